@@ -0,0 +1,57 @@
+'''
+Measures the cost the alert matcher adds per MB of output: a synthetic log is
+fed through a Stream with and without alert patterns. Prints the results as JSON.
+
+USAGE: python benchmarks/matcher.py [--size MB] [--patterns N]
+'''
+import getopt
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discordify.buffer import RingBuffer  # noqa: E402
+from discordify.matcher import Matcher  # noqa: E402
+from discordify.stream import CHUNK_SIZE, Stream  # noqa: E402
+
+PATTERNS = ['Traceback', 'CUDA error', r'Out of memory|OOM\b', r'Segmentation fault', r'FATAL|PANIC',
+            r'Killed process \d+', r'No space left on device', r'ERROR \[\w+\]']
+LINE = b'2026-10-17 12:00:00,000 INFO [worker-3] processed batch 1234 in 12.5 ms (loss=0.1234)\n'
+
+
+def run(data, matcher):
+    stream = Stream(None, None, RingBuffer(5), matcher.scanner('stdout') if matcher else None)
+    began = time.perf_counter()
+    for offset in range(0, len(data), CHUNK_SIZE):
+        stream.tap(data[offset:offset + CHUNK_SIZE])
+    return time.perf_counter() - began
+
+
+def main():
+    opts, _ = getopt.getopt(sys.argv[1:], '', ['size=', 'patterns='])
+    opts = dict(opts)
+    size = int(opts.get('--size', 64))
+    count = int(opts.get('--patterns', len(PATTERNS)))
+
+    data = LINE * (size * (1 << 20) // len(LINE))
+    alerts = []
+    matcher = Matcher((PATTERNS * count)[:count], alerts.append, context=3, debounce=60)
+
+    baseline = min(run(data, None) for _ in range(3))
+    matching = min(run(data, matcher) for _ in range(3))
+    megabytes = len(data) / (1 << 20)
+
+    print(json.dumps({
+        'size_mb': megabytes,
+        'patterns': count,
+        'baseline_ms_per_mb': baseline * 1000 / megabytes,
+        'matcher_ms_per_mb': matching * 1000 / megabytes,
+        'added_ms_per_mb': (matching - baseline) * 1000 / megabytes,
+        'alerts': len(alerts),
+    }, indent=4))
+
+
+if __name__ == '__main__':
+    main()
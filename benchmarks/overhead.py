@@ -0,0 +1,141 @@
+'''
+Measures what wrapping a command in discordify costs: the pass-through
+throughput (MB/s and lines/s) of a large output with and without discordify,
+for both engines and for SINK mode, the extra latency of single lines, and
+the peak RSS of discordify. Notifications go to a local stub webhook that can
+answer slowly, rate limit or fail. Prints the results as JSON.
+
+USAGE: python benchmarks/overhead.py [--size MB] [--lines N] [--stub_latency SECONDS] [--rate_limited SHARE] [--failing SHARE]
+'''
+import getopt
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from discordify.stream import CHUNK_SIZE  # noqa: E402
+from discordify.stub import StubServer  # noqa: E402
+
+LINE = b'2026-10-17 12:00:00,000 INFO [worker-3] processed batch 1234 in 12.5 ms (loss=0.1234)\n'
+# prints a timestamp (in nanoseconds) per line, every 10 ms
+TICKER = [sys.executable, '-S', '-c', 'import sys, time\nfor _ in range(int(sys.argv[1])):\n    print(time.time_ns(), flush=True)\n    time.sleep(0.01)']
+# runs a command and writes its peak RSS to a file, a forked child starts out with the peak RSS of its parent, so
+# this small process rather than the benchmark is the parent
+MEASURE = [sys.executable, '-S', '-c', 'import os, sys\npid = os.spawnvp(os.P_NOWAIT, sys.argv[2], sys.argv[2:])\n'
+           '_, status, usage = os.wait4(pid, 0)\nopen(sys.argv[1], "w").write(str(usage.ru_maxrss))\nsys.exit(os.waitstatus_to_exitcode(status))']
+
+
+def discordify(webhook, *options):
+    return [sys.executable, '-m', 'discordify', '--webhook', webhook, '--flush_timeout', '30'] + list(options) + ['--']
+
+
+def drain(command, stdin=subprocess.DEVNULL):
+    '''Runs `command`, reads its stdout to EOF. Returns the seconds taken, the bytes read and the peak RSS (in bytes).'''
+    with tempfile.NamedTemporaryFile('r') as rss:
+        began = time.perf_counter()
+        process = subprocess.Popen(MEASURE + [rss.name] + command, stdin=stdin, stdout=subprocess.PIPE)
+        size = 0
+        fd = process.stdout.fileno()
+        while True:
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+        process.stdout.close()
+        if process.wait():
+            raise RuntimeError('{} exited with {}.'.format(' '.join(command[:4]), process.returncode))
+        elapsed = time.perf_counter() - began
+        # kilobytes on Linux, bytes on macOS
+        return elapsed, size, int(rss.read()) * (1 if sys.platform == 'darwin' else 1024)
+
+
+def throughput(command, path, lines, piped=False):
+    '''Measures the output of `command`, or with `piped` of the file piped through it.'''
+    with open(path if piped else os.devnull, 'rb') as source:
+        elapsed, size, rss = drain(command, source)
+    return {
+        'seconds': elapsed,
+        'mb_per_s': size / elapsed / (1 << 20),
+        'lines_per_s': lines / elapsed,
+        # for the direct run this is the floor of the measurement
+        'peak_rss_bytes': rss,
+    }
+
+
+def latency(command, lines):
+    '''Returns the median and 99th percentile of the time (in µs) a line takes to arrive.'''
+    process = subprocess.Popen(command + [str(lines)], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+    delays = []
+    for line in process.stdout:
+        now = time.time_ns()
+        try:
+            delays.append((now - int(line)) / 1000)
+        except ValueError:
+            # not written by the ticker
+            continue
+    process.wait()
+    delays.sort()
+    return {'p50_us': statistics.median(delays), 'p99_us': delays[int(len(delays) * 0.99) - 1]}
+
+
+def main():
+    opts, _ = getopt.getopt(sys.argv[1:], '', ['size=', 'lines=', 'stub_latency=', 'rate_limited=', 'failing='])
+    opts = dict(opts)
+    size = int(opts.get('--size', 128))
+    ticks = int(opts.get('--lines', 200))
+
+    stub = StubServer(latency=float(opts.get('--stub_latency', 0.05)), rate_limited=float(opts.get('--rate_limited', 0)),
+                      failing=float(opts.get('--failing', 0)), seed=1).start()
+    state = tempfile.mkdtemp(prefix='discordify-bench-')
+    # run against this checkout, keep undelivered notifications out of the user's outbox
+    os.environ['PYTHONPATH'] = ROOT
+    os.environ['XDG_STATE_HOME'] = state
+    os.environ.pop('DISCORDIFY_TESTING', None)
+
+    path = os.path.join(state, 'output.log')
+    lines = size * (1 << 20) // len(LINE)
+    with open(path, 'wb') as output:
+        block = LINE * (CHUNK_SIZE // len(LINE))
+        for _ in range(lines // (CHUNK_SIZE // len(LINE))):
+            output.write(block)
+        output.write(LINE * (lines % (CHUNK_SIZE // len(LINE))))
+
+    cat = ['cat', path]
+    results = {
+        'size_mb': size,
+        'lines': lines,
+        'stub': {'latency': stub.latency, 'rate_limited': stub.rate_limited, 'failing': stub.failing},
+        'throughput': {
+            'direct': throughput(cat, path, lines),
+            'threads': throughput(discordify(stub.url, '--engine', 'threads') + cat, path, lines),
+            'select': throughput(discordify(stub.url, '--engine', 'select') + cat, path, lines),
+            'sink': throughput(discordify(stub.url)[:-1], path, lines, piped=True),
+        },
+        'latency': {
+            'direct': latency(TICKER, ticks),
+            'threads': latency(discordify(stub.url, '--engine', 'threads') + TICKER, ticks),
+            'select': latency(discordify(stub.url, '--engine', 'select') + TICKER, ticks),
+        },
+    }
+    for engine in ('threads', 'select'):
+        results['latency'][engine]['extra_p50_us'] = results['latency'][engine]['p50_us'] - results['latency']['direct']['p50_us']
+    results['webhook'] = {
+        'requests': len(stub.requests),
+        'statuses': {str(status): sum(1 for request in stub.requests if request['status'] == status)
+                     for status in sorted({request['status'] for request in stub.requests})},
+    }
+
+    stub.shutdown()
+    shutil.rmtree(state, ignore_errors=True)
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Measures the cost of rendering the payload of every event, as embed and as
+simple message, of preparing a renderer (done once per command) and of
+serializing the final report. Prints the results as JSON.
+
+USAGE: python benchmarks/render.py [--runs N] [--lines N]
+'''
+import getopt
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discordify.config import Arguments  # noqa: E402
+from discordify.data import Data  # noqa: E402
+from discordify.event import Event  # noqa: E402
+from discordify.matcher import Alert  # noqa: E402
+from discordify.mode import Mode  # noqa: E402
+from discordify.render import Renderer  # noqa: E402
+from discordify.serialize import backend, dumps  # noqa: E402
+
+LINE = '2026-10-17 12:00:00,000 INFO [worker-3] processed'
+
+
+def config(*options):
+    sys.argv = ['discordify', '--webhook', 'http://localhost/'] + list(options) + ['--', 'true']
+    return Arguments().parse().config
+
+
+def data(lines):
+    buffer = ''.join(LINE + '\n' for _ in range(lines))
+    now = time.time()
+    return Data(arguments=['train.py', '--epochs', '10'], pid=1234, start_time=now - 3600, end_time=now,
+                mode=Mode.SINK, stdin_lines=0, stdout_lines=100000, stderr_lines=10,
+                stdin_buffer='', stdout_buffer=buffer, stderr_buffer=buffer, returncode=0,
+                resources={'cpu_avg': 95.0, 'cpu_max': 100.0, 'rss_avg': 1 << 30, 'rss_peak': 1 << 31,
+                           'read_bytes': 1 << 20, 'write_bytes': 1 << 20, 'threads_max': 8, 'overhead': 0.002},
+                throughput={'stdout': {'bytes': 1 << 24, 'byte_rate': 4096.0, 'line_rate': 80.0, 'peak_byte_rate': 8192.0}})
+
+
+def measure(function, runs):
+    began = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - began) * 1e6 / runs
+
+
+def main():
+    opts, _ = getopt.getopt(sys.argv[1:], '', ['runs=', 'lines='])
+    opts = dict(opts)
+    runs = int(opts.get('--runs', 10000))
+    lines = int(opts.get('--lines', 5))
+
+    sample = data(lines)
+    alert = Alert('stdout', 'Traceback', 'Traceback (most recent call last):', [LINE] * 7)
+    results = {'runs': runs, 'lines': lines, 'serializer': backend().__module__}
+    for style, options in (('embed', ()), ('message', ('--simple',))):
+        settings = config(*options)
+        renderer = Renderer.create(settings)
+        results[style] = {
+            'prepare_us': measure(lambda: Renderer.create(settings), max(1, runs // 10)),
+        }
+        for event in Event:
+            results[style][event.name.lower() + '_us'] = measure(lambda: renderer.render(event, sample, alert), runs)
+        payload = renderer.render(Event.FINAL, sample)
+        results[style]['serialize_us'] = measure(lambda: dumps(payload), runs)
+        results[style]['size_bytes'] = len(dumps(payload))
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''
+Measures the cold start of the discordify CLI: the import time of the package
+(via `-X importtime`) and the time from launching discordify until the wrapped
+child runs, compared to launching the child directly. Prints the results as JSON.
+
+USAGE: python benchmarks/startup.py [--runs N] [--budget MILLISECONDS]
+'''
+import getopt
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# prints the time it was executed at, in nanoseconds
+CHILD = [sys.executable, '-S', '-c', 'import time; print(time.time_ns())']
+# modules that must not be loaded before the child is spawned
+HEAVY_MODULES = ['requests', 'urllib3', 'psutil', 'distutils']
+
+
+def import_time():
+    '''Returns the cumulative import time (in ms) of discordify and the heavy modules it loaded.'''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import discordify.__main__'],
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total, loaded = 0, []
+    for line in result.stderr.splitlines():
+        _, _, cumulative, name = [part.strip() for part in line.replace(':', '|', 1).split('|')]
+        if name in ('discordify', 'discordify.__main__') and cumulative.isdigit():
+            total = max(total, int(cumulative))
+        if name in HEAVY_MODULES:
+            loaded.append(name)
+    return total / 1000, loaded
+
+
+def time_to_exec(command):
+    '''Returns the time (in ms) between launching `command` and the child printing its timestamp.'''
+    start = time.time_ns()
+    result = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return (int(result.stdout.split()[0]) - start) / 1e6
+
+
+def main():
+    opts, _ = getopt.getopt(sys.argv[1:], '', ['runs=', 'budget='])
+    opts = dict(opts)
+    runs = int(opts.get('--runs', 20))
+
+    # no notifications are posted in testing mode, run against this checkout
+    os.environ['DISCORDIFY_TESTING'] = '1'
+    os.environ['PYTHONPATH'] = ROOT
+    wrapped = [sys.executable, '-m', 'discordify', '--webhook', 'http://127.0.0.1:9/'] + CHILD
+
+    direct = [time_to_exec(CHILD) for _ in range(runs)]
+    through = [time_to_exec(wrapped) for _ in range(runs)]
+    imports, loaded = import_time()
+
+    results = {
+        'import_ms': imports,
+        'heavy_modules_loaded': loaded,
+        'direct_exec_ms': statistics.median(direct),
+        'discordify_exec_ms': statistics.median(through),
+        'overhead_ms': statistics.median(through) - statistics.median(direct),
+        'runs': runs,
+    }
+    print(json.dumps(results, indent=4))
+
+    if '--budget' in opts and results['overhead_ms'] > float(opts['--budget']):
+        print('Cold start overhead exceeds the budget of {} ms.'.format(opts['--budget']), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Runs all benchmarks and writes their results into one JSON document, along
+with the commit, Python version and machine they ran on, so regressions can
+be tracked across runs. With --quick the benchmarks run on smaller inputs.
+
+USAGE: python benchmarks/suite.py [--output FILE] [--quick]
+'''
+import getopt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+
+# name: (script, options, quick options)
+SUITE = {
+    'startup': ('startup.py', [], ['--runs', '5']),
+    'render': ('render.py', [], ['--runs', '1000']),
+    'matcher': ('matcher.py', [], ['--size', '8']),
+    'overhead': ('overhead.py', [], ['--size', '16', '--lines', '50']),
+    # the webhook rate limits and fails, the reports are retried
+    'overhead_unreliable_webhook': ('overhead.py', ['--size', '16', '--lines', '50', '--rate_limited', '0.3', '--failing', '0.1'], []),
+}
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    opts, _ = getopt.getopt(sys.argv[1:], '', ['output=', 'quick'])
+    opts = dict(opts)
+
+    results = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'benchmarks': {},
+    }
+    for name, (script, options, quick) in SUITE.items():
+        print('Running {}...'.format(name), file=sys.stderr)
+        began = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(BENCHMARKS, script)] + options + (quick if '--quick' in opts else []),
+                                stdout=subprocess.PIPE, universal_newlines=True)
+        if result.returncode:
+            results['benchmarks'][name] = {'error': 'exited with {}'.format(result.returncode)}
+            continue
+        results['benchmarks'][name] = json.loads(result.stdout)
+        results['benchmarks'][name]['duration_s'] = time.perf_counter() - began
+
+    document = json.dumps(results, indent=4)
+    if '--output' in opts:
+        with open(opts['--output'], 'w') as output:
+            output.write(document + '\n')
+    else:
+        print(document)
+
+
+if __name__ == '__main__':
+    main()
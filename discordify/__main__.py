@@ -2,6 +2,7 @@ import getopt
 import sys
 
 import discordify.exit_codes as codes
+from discordify.batch import Batch
 from discordify.command import Command
 from discordify.config import Arguments, Config
 
@@ -11,6 +12,12 @@ def main():
 
     try:
         command = arguments.parse()
+        if command.config.flush_outbox:
+            sys.exit(command.flush_outbox())
+        if command.config.digest:
+            sys.exit(command.digest())
+        if command.config.batch:
+            sys.exit(Batch(command.config).run())
         try:
             command.run()
             command.wait()
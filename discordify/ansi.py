@@ -0,0 +1,74 @@
+import re
+
+# complete escape sequences (CSI, OSC, charset selection and other two byte
+# sequences) and the control characters that do not move to a new line
+ESCAPE = re.compile(rb'\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[ -/]*[0-~])?|[\x00-\x08\x0b\x0c\x0e-\x1a\x1c-\x1f\x7f]')
+# the control characters alone, stripped without a regular expression
+CONTROLS = bytes(range(0x00, 0x09)) + b'\x0b\x0c' + bytes(range(0x0e, 0x20)) + b'\x7f'
+# an escape sequence cut off at the end of a chunk
+INCOMPLETE = re.compile(rb'\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]*\x1b?|[ -/]*)\Z')
+# longest escape sequence carried over to the next chunk, longer ones are dropped
+MAX_CARRY = 4096
+# longest line held back for carriage returns, longer ones are passed on as they are
+MAX_LINE = 1 << 16
+
+
+def collapse(line):
+    '''Keeps what a terminal would show of a line rewritten with carriage returns.'''
+    text = line.rstrip(b'\r')
+    return line[text.rfind(b'\r') + 1:]
+
+
+class Sanitizer:
+    '''
+    Turns terminal output into plain text, chunk by chunk: escape sequences
+    (colors, cursor movement, titles) and control characters are stripped,
+    lines rewritten with carriage returns (progress bars) are collapsed to
+    their last version. Sequences cut between chunks are carried over, the
+    current line is held back until it ends (or gets too long), so a report
+    never shows half a sequence or a stale rewrite.
+    '''
+
+    def __init__(self):
+        self.__carry = b''
+        self.__line = b''
+
+    def feed(self, chunk):
+        '''Returns the plain text of the complete lines of `chunk`.'''
+        data = self.__carry + chunk if self.__carry else chunk
+        self.__carry = b''
+        # binary data (NUL bytes never occur in text) only loses its control characters
+        if b'\x1b' in data and b'\x00' not in data:
+            start = data.rfind(b'\x1b')
+            if start == len(data) - 1:
+                # possibly the first byte of the terminator (ESC \) of a title
+                previous = data.rfind(b'\x1b', 0, start)
+                if previous >= 0 and INCOMPLETE.match(data, previous):
+                    start = previous
+            match = INCOMPLETE.match(data, start)
+            if match:
+                self.__carry = data[match.start():] if len(data) - match.start() <= MAX_CARRY else b''
+                data = data[:match.start()]
+            data = ESCAPE.sub(b'', data)
+        else:
+            data = data.translate(None, CONTROLS)
+
+        end = data.rfind(b'\n') + 1
+        if not end:
+            line = self.__line + data
+            self.__line = collapse(line) if b'\r' in line else line
+            if len(self.__line) > MAX_LINE:
+                line, self.__line = self.__line.replace(b'\r', b''), b''
+                return line
+            return b''
+
+        text = self.__line + data[:end]
+        self.__line = collapse(data[end:])
+        if b'\r' not in text:
+            return text
+        return b'\n'.join(collapse(line).rstrip(b'\r') for line in text.split(b'\n'))
+
+    def close(self):
+        '''Returns the text held back, the line that did not end.'''
+        line, self.__line, self.__carry = self.__line.rstrip(b'\r'), b'', b''
+        return line
@@ -0,0 +1,157 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import uuid
+
+from discordify.serialize import dumps
+
+# Discord accepts at most 10 files per message
+MAX_FILES = 10
+# size of the chunks the body is streamed in
+CHUNK_SIZE = 1 << 16
+
+
+class Part:
+    '''A byte range of an open file, uploaded as (part of) an attachment.'''
+
+    def __init__(self, filename, source, offset=0, length=None):
+        self.filename = filename
+        self.source = source
+        self.offset = offset
+        self.length = os.fstat(source.fileno()).st_size - offset if length is None else length
+
+
+def prepare(name, files, limit, directory):
+    '''
+    Returns the parts to upload the spooled segments `files` (oldest first) of
+    the stream `name` as. The log is uploaded as it is if it fits into `limit`
+    bytes, otherwise it is gzipped. A log that does not fit compressed is split
+    into numbered parts of `limit` bytes.
+    '''
+    sources = [open(path, 'rb') for path in files]
+    sizes = [os.fstat(source.fileno()).st_size for source in sources]
+    if not sum(sizes):
+        for source in sources:
+            source.close()
+        return []
+
+    if sum(sizes) <= limit and not any(path.endswith('.gz') for path in files):
+        parts = []
+        for source, size in zip(sources, sizes):
+            if size:
+                parts.append(Part(name + '.log', source, 0, size))
+            else:
+                source.close()
+        return parts
+
+    filename = name + '.log.gz'
+    # an unlinked file only readable by the user, it is removed once the parts are closed after the upload
+    compressed = tempfile.TemporaryFile(dir=directory, prefix=filename + '.')
+    # a gzip file may consist of several members, so compressed segments are copied as they are
+    for segment, source in zip(files, sources):
+        with source:
+            if segment.endswith('.gz'):
+                shutil.copyfileobj(source, compressed, CHUNK_SIZE)
+            else:
+                with gzip.GzipFile(filename=name + '.log', fileobj=compressed, mode='wb') as target:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+    compressed.flush()
+
+    size = os.fstat(compressed.fileno()).st_size
+    if size <= limit:
+        return [Part(filename, compressed)]
+
+    count = (size + limit - 1) // limit
+    return [Part('{}.{:03d}'.format(filename, index + 1), compressed, index * limit, min(limit, size - index * limit))
+            for index in range(count)]
+
+
+def pack(parts, limit):
+    '''
+    Groups the parts into messages of at most `limit` bytes and `MAX_FILES`
+    files. Parts sharing a file name are consecutive segments of the same log
+    and are uploaded as one attachment.
+    '''
+    messages = []
+    files, size = [], 0
+    for part in parts:
+        if files and files[-1][0].filename == part.filename:
+            files[-1].append(part)
+            size += part.length
+            continue
+        if files and (len(files) == MAX_FILES or size + part.length > limit):
+            messages.append(files)
+            files, size = [], 0
+        files.append([part])
+        size += part.length
+    if files:
+        messages.append(files)
+    return messages
+
+
+class MultipartBody:
+    '''
+    A `multipart/form-data` request body with a JSON payload and attachments,
+    read from disk in chunks while it is sent. Knows its length up front, so
+    no chunked transfer encoding is needed, and is rewound for retries.
+    '''
+
+    def __init__(self, payload, attachments):
+        self.__boundary = uuid.uuid4().hex
+        segments = [self.__header('payload_json', 'application/json'),
+                    dumps(payload)]
+        for index, parts in enumerate(attachments):
+            segments.append(self.__header('files[{}]'.format(index), 'application/octet-stream', parts[0].filename))
+            segments.extend(parts)
+        segments.append('\r\n--{}--\r\n'.format(self.__boundary).encode('ascii'))
+        self.__segments = segments
+        self.__length = sum(len(segment) if isinstance(segment, bytes) else segment.length for segment in segments)
+        self.seek(0)
+
+    def __header(self, name, content_type, filename=None):
+        disposition = 'form-data; name="{}"'.format(name)
+        if filename:
+            disposition += '; filename="{}"'.format(filename)
+        return '\r\n--{}\r\nContent-Disposition: {}\r\nContent-Type: {}\r\n\r\n'.format(
+            self.__boundary, disposition, content_type).encode('utf-8')
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary=' + self.__boundary
+
+    def __len__(self):
+        return self.__length
+
+    def seek(self, position, whence=io.SEEK_SET):
+        '''Only rewinding to the start is supported.'''
+        if position or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('can only rewind')
+        self.__index = 0
+        self.__position = 0
+
+    def tell(self):
+        return sum(len(segment) if isinstance(segment, bytes) else segment.length for segment in self.__segments[:self.__index]) + self.__position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(CHUNK_SIZE), b''))
+        while self.__index < len(self.__segments):
+            segment = self.__segments[self.__index]
+            if isinstance(segment, bytes):
+                chunk = segment[self.__position:self.__position + size]
+            else:
+                remaining = segment.length - self.__position
+                chunk = os.pread(segment.source.fileno(), min(size, remaining), segment.offset + self.__position) if remaining > 0 else b''
+            if chunk:
+                self.__position += len(chunk)
+                return chunk
+            self.__index += 1
+            self.__position = 0
+        return b''
+
+    def close(self):
+        for segment in self.__segments:
+            if not isinstance(segment, bytes):
+                segment.source.close()
@@ -0,0 +1,123 @@
+import getopt
+import os
+import shlex
+import sys
+import threading
+import time
+
+import discordify.exit_codes as codes
+from discordify.command import Command
+from discordify.dispatch import Dispatcher
+from discordify.event import Event
+from discordify.payload import TEST_MODE, Payload
+from discordify.record import Record, Summary, command_line
+from discordify.target import Target
+from discordify.utils import hostname
+
+# options of the batch that do not apply to its commands
+JOB_OVERRIDES = {'periodic': None, 'alert': None, 'spool_dir': None, 'attach_logs': None, 'edit_in_place': None, 'heartbeat': None, 'timeout_warning': None}
+
+
+def read_jobs(path):
+    '''Reads the commands of a batch, one per line, blank lines and comments are skipped.'''
+    try:
+        with (open(path) if path != '-' else sys.stdin) as source:
+            return [args for args in (shlex.split(line, comments=True) for line in source) if args]
+    except (OSError, ValueError) as err:
+        raise getopt.GetoptError('Invalid batch "{}": {}'.format(path, err))
+
+
+class Batch:
+    '''
+    Runs the commands of a batch with at most `jobs` of them at the same
+    time. The commands do not notify on their own, each is condensed into a
+    record and the batch reports progress and the final summary once for
+    all of them.
+    '''
+
+    def __init__(self, config):
+        self.__config = config
+        self.__jobs = read_jobs(config.batch)
+        self.__title = os.path.basename(config.batch) if config.batch != '-' else None
+        self.__pending = iter(enumerate(self.__jobs, 1))
+        self.__records = []
+        self.__running = {}
+        self.__lock = threading.Lock()
+        self.__finished = threading.Event()
+        self.__stopped = False
+        self.__start_time = 0
+        self.__dispatcher = Dispatcher()
+        self.__targets = [Target(target) for target in config.targets or [config]]
+
+    def run(self):
+        '''Runs the batch and reports on it, returns the exit code.'''
+        self.__start_time = time.time()
+        if not self.__jobs:
+            self.__finished.set()
+
+        workers = [threading.Thread(target=self.__work, name='BATCH', daemon=True) for _ in range(max(1, min(self.__config.jobs, len(self.__jobs))))]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while not self.__finished.wait(self.__config.periodic):
+                self.__notify(Event.PERIOD)
+        except KeyboardInterrupt:
+            self.__interrupt(workers)
+            return codes.EXIT_INTERRUPTED
+
+        summary = self.__notify(Event.FINAL)
+        deadline = time.monotonic() + self.__config.flush_timeout
+        if not self.__dispatcher.close(self.__config.flush_timeout) and not TEST_MODE:
+            self.__replay_outbox(deadline)
+        return codes.EXIT_OK if summary.success else codes.EXIT_BATCH_FAILED
+
+    def __work(self):
+        while True:
+            with self.__lock:
+                index, args = next(self.__pending, (None, None))
+                if self.__stopped or index is None:
+                    return
+                command = self.__running[index] = Command(self.__config.derive(JOB_OVERRIDES), args, standalone=False)
+
+            try:
+                command.run()
+                command.wait()
+                record = Record.from_data(index, command.data)
+            except OSError as err:
+                # e.g. the command does not exist, like a shell would
+                record = Record(index, command_line(args), 127, 0.0, time.time(), hostname(), str(err))
+
+            with self.__lock:
+                del self.__running[index]
+                self.__records.append(record)
+                if len(self.__records) == len(self.__jobs):
+                    self.__finished.set()
+
+    def __interrupt(self, workers):
+        '''Stops the running commands, waits for their records and reports the partial summary.'''
+        with self.__lock:
+            self.__stopped = True
+            running = list(self.__running.values())
+        for command in running:
+            command.handle_interrupt()
+        for worker in workers:
+            worker.join(self.__config.flush_timeout)
+        self.__notify(Event.INTERRUPT)
+        self.__dispatcher.close(self.__config.flush_timeout)
+
+    def __notify(self, event):
+        with self.__lock:
+            summary = Summary(self.__records, len(self.__jobs), self.__title, self.__start_time, time.time())
+        for target in self.__targets:
+            Payload.create(target.config, summary, self.__dispatcher, renderer=target.renderer).emit_summary(event)
+        return summary
+
+    def __replay_outbox(self, deadline):
+        '''Replays the entries of the webhooks of the batch, in what is left of the flush timeout.'''
+        from discordify.outbox import Outbox, outbox_path
+
+        outbox = Outbox(self.__config.outbox or outbox_path())
+        if outbox.pending() and time.monotonic() < deadline:
+            outbox.replay(self.__config.retries, self.__config.rate_limit, self.__config.rate_burst,
+                          {target.config.webhook for target in self.__targets}, deadline)
@@ -0,0 +1,99 @@
+from collections import deque
+
+
+class RingBuffer:
+    '''
+    Keeps the tail of a byte stream in a fixed `bytearray` of `max_bytes`,
+    with an index of where each of the last `max_lines` lines starts. Lines are
+    truncated to `line_length` bytes while they are captured, so memory stays
+    bounded no matter how long a line gets. Decoding is deferred until the
+    buffer is rendered.
+    '''
+
+    # takes the plain text of the output
+    raw = False
+
+    def __init__(self, max_lines, max_bytes=4096, line_length=50):
+        self.__max_lines = max_lines
+        self.__capacity = max(1, max_bytes)
+        self.__line_length = min(line_length, self.__capacity)
+        self.__ring = bytearray(self.__capacity)
+        # absolute offsets (bytes ever written) of the buffered lines
+        self.__starts = deque()
+        self.__written = 0
+        self.__open = False
+        self.__current = 0
+
+    def __write(self, data):
+        offset = self.__written % self.__capacity
+        first = min(len(data), self.__capacity - offset)
+        self.__ring[offset:offset + first] = data[:first]
+        if first < len(data):
+            self.__ring[:len(data) - first] = data[first:]
+        self.__written += len(data)
+
+    def __read(self, start, end):
+        offset = start % self.__capacity
+        length = end - start
+        if offset + length <= self.__capacity:
+            return bytes(self.__ring[offset:offset + length])
+        return bytes(self.__ring[offset:]) + bytes(self.__ring[:offset + length - self.__capacity])
+
+    def append(self, chunk):
+        if not self.__max_lines:
+            return
+
+        pos = 0
+        last = chunk.rfind(b'\n')
+        if last >= 0:
+            # walk back over at most `max_lines` newlines, anything before is never reported
+            start = last
+            for _ in range(self.__max_lines):
+                start = chunk.rfind(b'\n', 0, start)
+                if start < 0:
+                    break
+            if start >= 0:
+                self.__open = False
+                pos = start + 1
+
+        size = len(chunk)
+        while pos < size:
+            newline = chunk.find(b'\n', pos)
+            end = size if newline < 0 else newline
+
+            if not self.__open:
+                self.__starts.append(self.__written)
+                self.__open = True
+                self.__current = 0
+
+            take = min(end - pos, self.__line_length - self.__current)
+            if take > 0:
+                cut = pos + take
+                if cut < end:
+                    # do not split a multi-byte UTF-8 sequence
+                    while cut > pos and chunk[cut] & 0xC0 == 0x80:
+                        cut -= 1
+                    self.__current = self.__line_length
+                else:
+                    self.__current += take
+                self.__write(chunk[pos:cut])
+
+            if newline < 0:
+                break
+            self.__open = False
+            pos = newline + 1
+
+        while len(self.__starts) > self.__max_lines or self.__starts and self.__written - self.__starts[0] > self.__capacity:
+            self.__starts.popleft()
+
+    def decode(self):
+        '''Returns the buffered lines as strings, including a trailing partial line.'''
+        starts = list(self.__starts)
+        ends = starts[1:] + [self.__written]
+        return [str(self.__read(start, end), 'utf-8', 'replace') for start, end in zip(starts, ends)]
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.__starts)
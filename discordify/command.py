@@ -1,25 +1,65 @@
+import os
+import shutil
 import signal
 import subprocess
 import sys
+import tempfile
 import threading
 import time
-from collections import deque
 from datetime import timedelta
 from os import close, getpgid, getpid
 
-import discordify.utils as utils
+
 import discordify.exit_codes as codes
+import discordify.stats as stats
+from discordify.ansi import Sanitizer
+from discordify.buffer import RingBuffer
+from discordify.dispatch import Dispatcher
+from discordify.engine import SelectorEngine
+from discordify.matcher import Matcher
 from discordify.mode import Mode
 from discordify.data import Data
-from discordify.payload import Payload
-from psutil import virtual_memory
+from discordify.event import Event
+from discordify.payload import TEST_MODE, Payload
+from discordify.sampler import Sampler
+from discordify.scheduler import Scheduler
+from discordify.spool import Spool
+from discordify.stream import Stream
+from discordify.target import Target
+
+
+def open_pty():
+    '''
+    Opens a pseudo-terminal for the output of the child, so it is line
+    buffered like on a terminal. Returns the (master, slave) descriptors.
+    '''
+    import fcntl
+    import pty
+    import termios
+
+    master, slave = pty.openpty()
+    attributes = termios.tcgetattr(slave)
+    # keep the newlines of the child as they are rather than turning them into \r\n
+    attributes[1] &= ~termios.ONLCR
+    termios.tcsetattr(slave, termios.TCSANOW, attributes)
+    if sys.stdout.isatty():
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, b'\0' * 8))
+    os.set_inheritable(slave, True)
+    return master, slave
 
 
 class Command:
-
-    def __init__(self, config, args):
+    '''
+    Runs a command, tees its output and reports on it. A command that is not
+    `standalone` runs as one of many (e.g. in a batch): it does not touch the
+    signal handlers or stdin of the process and sends no notifications, its
+    results are taken from `data` instead.
+    '''
+
+    def __init__(self, config, args, standalone=True):
         self.__config = config
         self.__args = args
+        self.__standalone = standalone
         self.__process = None
         self.__stdin_thread = None
         self.__stdout_thread = None
@@ -27,80 +67,124 @@ class Command:
         self.__start_time = 0
         self.__end_time = None
         self.__terminate = False
-        self.__stdin_buffer = deque(maxlen=config.buffer_size)
-        self.__stdout_buffer = deque(maxlen=config.buffer_size)
-        self.__stderr_buffer = deque(maxlen=config.buffer_size)
-        self.__stdin_lines = 0
-        self.__stdout_lines = 0
-        self.__stderr_lines = 0
-        self.__cpu_usage = deque(maxlen=100)
-        self.__period_timer = None
-        self.__timeout_timer = None
+        self.__stdin = None
+        self.__stdout = None
+        self.__stderr = None
+        self.__engine = None
+        self.__dispatcher = Dispatcher()
+        # templates and the static parts of the payloads are prepared once per target
+        self.__targets = [Target(target) for target in config.targets or [config]] if standalone else []
+        self.__attach_logs = any(target.config.attach_logs for target in self.__targets)
+        self.__sampler = None
+        self.__spool_dir = None
+        # one heap of deadlines for all timed events, driven by the engine or its own thread
+        self.__scheduler = Scheduler()
+        self.__matcher = Matcher(config.alert, self.__handle_alert, config.alert_context, config.alert_debounce, self.__scheduler) if config.alert else None
         self.__mode = Mode.SINK
         self.__exitcode = codes.EXIT_OK
 
     def run(self):
         self.__start_time = time.time()
+        if self.__config.stats:
+            stats.enable()
+
+        if self.__config.spool_dir:
+            self.__spool_dir = os.path.join(self.__config.spool_dir, '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+            os.makedirs(self.__spool_dir, mode=0o700, exist_ok=True)
+        elif self.__attach_logs:
+            # the logs are only kept until they are uploaded
+            self.__spool_dir = tempfile.mkdtemp(prefix='discordify-')
+
+        if self.__args and not self.__standalone:
+            self.__process = subprocess.Popen(self.__args, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            self.__stdout = self.__stream(self.__process.stdout, sys.stdout.fileno(), 'stdout')
+            self.__stderr = self.__stream(self.__process.stderr, sys.stderr.fileno(), 'stderr')
+        elif self.__args:
+            terminal = open_pty() if self.__config.pty else None
+            self.__process = subprocess.Popen(self.__args, stdout=terminal[1] if terminal else subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+            if terminal:
+                # only the child writes to the terminal, we read what it wrote
+                os.close(terminal[1])
+            if not sys.stdin.isatty():
+                self.__stdin = self.__stream(sys.stdin.buffer, self.__process.stdin.fileno(), 'stdin')
+            else:
+                # nothing is forwarded from a terminal, the child reads EOF rather than waiting for it
+                self.__process.stdin.close()
+            self.__stdout = self.__stream(os.fdopen(terminal[0], 'rb', buffering=0) if terminal else self.__process.stdout, sys.stdout.fileno(), 'stdout')
+            self.__stderr = self.__stream(self.__process.stderr, sys.stderr.fileno(), 'stderr')
+            if self.__config.system_stats:
+                self.__sampler = Sampler(self.__process.pid)
+        elif not sys.stdin.isatty():
+            self.__stdin = self.__stream(sys.stdin.buffer, sys.stdout.fileno(), 'stdin')
+
+        if self.__standalone:
+            # register SIGUSR1 to force a periodic report.
+            signal.signal(signal.SIGUSR1, self.__handle_signal)
+            signal.signal(signal.SIGPIPE, self.__shutdown)
+            if self.__config.stats:
+                signal.signal(signal.SIGUSR2, self.__dump_stats)
+
+        self.__schedule()
+        if self.__config.engine == 'select':
+            self.__run_engine()
+        else:
+            self.__run_threads()
+
+    def __schedule(self):
+        config = self.__config
+        if config.periodic:
+            self.__scheduler.call_later(config.periodic, self.__report_period, config.periodic)
+
+        if config.timeout:
+            self.__scheduler.call_later(config.timeout, self.__handle_timeout)
+            if config.timeout_warning and 0 < config.timeout_warning < 1:
+                self.__scheduler.call_later(config.timeout * config.timeout_warning, self.__handle_deadline)
+
+        if config.heartbeat:
+            self.__scheduler.call_later(config.heartbeat, self.__handle_heartbeat)
+
+        if self.__sampler:
+            self.__scheduler.call_later(0, self.__sampler.sample, config.sample_interval)
+
+    def __run_engine(self):
+        self.__engine = SelectorEngine(self.__scheduler)
 
         if self.__args:
-            self.__process = subprocess.Popen(self.__args, stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-            self.__stdin_thread = threading.Thread(target=self.__process_stdin, name='STDIN')
-            self.__stdout_thread = threading.Thread(target=self.__process_stdout, name='STDOUT')
-            self.__stderr_thread = threading.Thread(target=self.__process_stderr, name='STDERR')
-            self.__stdin_thread.start()
+            if self.__stdin:
+                self.__engine.add_inlet(self.__stdin, self.__process.stdin)
+            self.__engine.add_stream(self.__stdout)
+            self.__engine.add_stream(self.__stderr)
+        elif self.__stdin:
+            self.__engine.add_stream(self.__stdin)
+
+    def __run_threads(self):
+        if self.__args:
+            if self.__stdin:
+                self.__stdin_thread = threading.Thread(target=self.__process_stdin, name='STDIN')
+                self.__stdin_thread.start()
+            self.__stdout_thread = threading.Thread(target=self.__stdout.pump, name='STDOUT')
+            self.__stderr_thread = threading.Thread(target=self.__stderr.pump, name='STDERR')
             self.__stdout_thread.start()
             self.__stderr_thread.start()
         elif not sys.stdin.isatty():
             self.__stdin_thread = threading.Thread(target=self.__process_stdin, name='STDIN')
             self.__stdin_thread.start()
 
-        # register SIGUSR1 to force a periodic report.
-        signal.signal(signal.SIGUSR1, self.__handle_signal)
-        signal.signal(signal.SIGPIPE, self.__shutdown)
-
-        if self.__config.periodic:
-            self.__period_timer = threading.Timer(self.__config.periodic, self.__handle_period)
-            self.__period_timer.start()
-
-        if self.__config.timeout:
-            self.__timeout_timer = threading.Timer(self.__config.timeout, self.__handle_timeout)
-            self.__timeout_timer.start()
+        # alerts schedule their grace periods once they match
+        if len(self.__scheduler) or self.__matcher:
+            self.__scheduler.start()
 
     def __process_stdin(self):
-        try:
-            if not sys.stdin.isatty():
-                for line in sys.stdin:
-                    if self.__terminate or self.__args and self.__process.poll():
-                        break
-                    self.__stdin_buffer.append(str(line))
-                    self.__stdin_lines += 1
-                    if self.__args:
-                        self.__process.stdin.write(bytes(line, 'utf-8'))
-                    else:
-                        sys.stdout.write(line)
-                if self.__args:
-                    self.__process.stdin.close()
-        except BrokenPipeError:
-            pass
-
-    def __process_stdout(self):
-        with self.__process.stdout as output:
-            for line in iter(output.readline, b''):
-                self.__stdout_buffer.append(str(line, 'utf-8'))
-                self.__stdout_lines += 1
-                sys.stdout.write(str(line, 'utf-8'))
-
-    def __process_stderr(self):
-        with self.__process.stderr as output:
-            for line in iter(output.readline, b''):
-                self.__stderr_buffer.append(str(line, 'utf-8'))
-                self.__stderr_lines += 1
-                sys.stderr.write(str(line, 'utf-8'))
+        '''Forwards stdin to the child (or stdout) in large binary chunks, as long as anybody reads it.'''
+        self.__stdin.pump(drain=False)
+        if self.__args:
+            try:
+                self.__process.stdin.close()
+            except BrokenPipeError:
+                pass
 
     def __stop_threads(self):
-        for timer in [self.__period_timer, self.__timeout_timer]:
-            if timer:
-                timer.cancel()
+        self.__scheduler.stop()
 
         for thread in [self.__stdin_thread, self.__stdout_thread, self.__stderr_thread]:
             try:
@@ -113,21 +197,37 @@ class Command:
     def exit_code(self):
         return self.__exitcode
 
-    def __monitor(self):
-        while not self.__terminate:
-            self.__cpu_usage.append(utils.cpu_percent())
+    @property
+    def config(self):
+        return self.__config
+
+    def __buffer(self, name):
+        if self.__spool_dir:
+            return Spool(self.__spool_dir, name, self.__config.buffer_size, self.__config.line_length,
+                         self.__config.spool_size, self.__config.spool_segments, self.__config.spool_compress)
+        return RingBuffer(self.__config.buffer_size, self.__config.buffer_bytes, self.__config.line_length)
+
+    def __stream(self, source, sink, name):
+        # the terminal gets the raw output, the reports plain text
+        return Stream(source, sink, self.__buffer(name), self.__scanner(name) if name != 'stdin' else None, Sanitizer(), name)
+
+    def __scanner(self, stream):
+        return self.__matcher.scanner(stream) if self.__matcher else None
 
     def __prep_buffer(self, buffer):
         '''
-        Takes a buffer (deque) and returns a string, truncating the lines 
-        to 50 characters.
+        Takes a buffer (RingBuffer) and returns a string, the lines are already
+        truncated while they are captured.
         '''
-        return ''.join([(lambda x: x[:50])(x) for x in buffer])
+        return ''.join([line + '\n' for line in buffer.decode()]) if buffer else ''
 
     def wait(self, timeout=None):
+        if self.__engine:
+            self.__engine.run(self.__process)
+
         if self.__args:
             self.__process.wait(timeout=timeout)
-        else:
+        elif self.__stdin_thread:
             self.__stdin_thread.join()
 
         self.__terminate = True
@@ -137,8 +237,99 @@ class Command:
         self.report()
 
     def report(self):
-        payload = Payload.create(self.__config, self.data)
-        payload.emit_final()
+        if not self.__standalone:
+            self.__cleanup()
+            return
+
+        if self.__config.group:
+            self.__report_group()
+        else:
+            self.__notify(Event.FINAL)
+        deadline = time.monotonic() + self.__config.flush_timeout
+        if not self.__dispatcher.close(self.__config.flush_timeout):
+            # the webhooks are reachable again, catch up on what earlier runs could not deliver to them
+            self.__replay_outbox(deadline)
+        self.__dump_stats()
+        self.__cleanup()
+
+    def __report_group(self):
+        '''
+        Keeps the record of the run in its group instead of reporting it. The
+        run completing the group sends the digest of all of them.
+        '''
+        from discordify.digest import Digest, digest_dir, task_id
+        from discordify.record import Record
+
+        digest = Digest(self.__config.digest_dir or digest_dir(), self.__config.group)
+        try:
+            digest.write(Record.from_data(task_id(), self.data))
+        except OSError as err:
+            print('Failed to keep the record of the run in {}: {}'.format(digest.path, err), file=sys.stderr)
+            self.__notify(Event.FINAL)
+            return
+        group_size = self.__config.group_size
+        if group_size and digest.size >= group_size and digest.claim():
+            self.__notify_summary(Event.FINAL, digest.summary(group_size))
+
+    def digest(self):
+        '''Sends the digest of a group right away, returns the exit code.'''
+        from discordify.digest import Digest, digest_dir
+
+        try:
+            digest = Digest(self.__config.digest_dir or digest_dir(), self.__config.digest)
+        except ValueError as err:
+            print(err, file=sys.stderr)
+            return codes.EXIT_INVALID_ARGS
+        summary = digest.summary(self.__config.group_size)
+        if not summary.done:
+            print('No records in {}.'.format(digest.path), file=sys.stderr)
+            return codes.EXIT_INVALID_ARGS
+        self.__notify_summary(Event.FINAL, summary)
+        if self.__dispatcher.close(self.__config.flush_timeout):
+            return codes.EXIT_UNDELIVERED
+        return codes.EXIT_OK if summary.success else codes.EXIT_BATCH_FAILED
+
+    def __replay_outbox(self, deadline):
+        '''Replays the entries of the webhooks of this run, in what is left of the flush timeout.'''
+        if TEST_MODE:
+            return
+        from discordify.outbox import Outbox, outbox_path
+
+        outbox = Outbox(self.__config.outbox or outbox_path())
+        if outbox.pending() and time.monotonic() < deadline:
+            outbox.replay(self.__config.retries, self.__config.rate_limit, self.__config.rate_burst,
+                          {target.config.webhook for target in self.__targets}, deadline)
+
+    def flush_outbox(self):
+        '''Replays the outbox, returns the exit code.'''
+        from discordify.outbox import Outbox, outbox_path
+
+        outbox = Outbox(self.__config.outbox or outbox_path())
+        sent, kept = outbox.replay(self.__config.retries, self.__config.rate_limit, self.__config.rate_burst)
+        print('Replayed {} notification(s), {} kept in {}.'.format(sent, kept, outbox.path), file=sys.stderr)
+        return codes.EXIT_OK if not kept else codes.EXIT_UNDELIVERED
+
+    def __dump_stats(self, *args):
+        '''Writes the statistics of discordify itself to the --stats file, on SIGUSR2 and at exit.'''
+        if not stats.current:
+            return
+        streams = {}
+        for stream in (self.__stdin, self.__stdout, self.__stderr):
+            if stream:
+                streams[stream.name] = {'bytes': stream.bytes, 'lines': stream.lines, 'idle_s': stream.idle}
+                if isinstance(stream.buffer, RingBuffer):
+                    # lines that are no longer part of the reports
+                    streams[stream.name]['buffered_lines'] = len(stream.buffer)
+                    streams[stream.name]['dropped_lines'] = max(0, stream.lines - len(stream.buffer))
+        dispatcher = {'pending': self.__dispatcher.pending, 'coalesced': self.__dispatcher.coalesced}
+        try:
+            stats.current.dump(self.__config.stats, streams=streams, dispatcher=dispatcher)
+        except OSError as err:
+            print('Failed to write the statistics to {}: {}'.format(self.__config.stats, err), file=sys.stderr)
+
+    def __cleanup(self):
+        if self.__spool_dir and not self.__config.spool_dir:
+            shutil.rmtree(self.__spool_dir, ignore_errors=True)
 
     @property
     def data(self):
@@ -148,41 +339,64 @@ class Command:
                     end_time=self.__end_time if self.__end_time else time.time(),
                     mode=self.__mode,
                     returncode=self.__process.returncode if self.__args else 0,
-                    stdin_lines=self.__stdin_lines,
-                    stdout_lines=self.__stdout_lines,
-                    stderr_lines=self.__stderr_lines,
-                    stdin_buffer=self.__prep_buffer(self.__stdin_buffer),
-                    stdout_buffer=self.__prep_buffer(self.__stdout_buffer),
-                    stderr_buffer=self.__prep_buffer(self.__stderr_buffer))
-
-    def __handle_period(self):
-        if self.__period_timer:
-            self.__period_timer.cancel()
-
-        payload = Payload.create(self.__config, self.data)
-        payload.emit_period()
-
-        if not self.__terminate:
-            self.__period_timer = threading.Timer(self.__config.periodic, self.__handle_period)
-            self.__period_timer.start()
+                    coalesced=self.__dispatcher.coalesced,
+                    suppressed=self.__matcher.suppressed if self.__matcher else 0,
+                    spool_dir=self.__config.spool_dir and self.__spool_dir,
+                    logs={name: stream.buffer for name, stream in (('stdout', self.__stdout), ('stderr', self.__stderr)) if stream} if self.__attach_logs else None,
+                    resources=self.__sampler.summary if self.__sampler else None,
+                    throughput={name: stream.throughput for name, stream in (('stdin', self.__stdin), ('stdout', self.__stdout), ('stderr', self.__stderr)) if stream},
+                    stdin_lines=self.__stdin.lines if self.__stdin else 0,
+                    stdout_lines=self.__stdout.lines if self.__stdout else 0,
+                    stderr_lines=self.__stderr.lines if self.__stderr else 0,
+                    stdin_buffer=self.__prep_buffer(self.__stdin.buffer if self.__stdin else None),
+                    stdout_buffer=self.__prep_buffer(self.__stdout.buffer if self.__stdout else None),
+                    stderr_buffer=self.__prep_buffer(self.__stderr.buffer if self.__stderr else None))
+
+    def __notify(self, event, alert=None):
+        '''Emits the event to all targets, they are delivered concurrently by the dispatcher.'''
+        data = self.data
+        for target in self.__targets:
+            Payload.create(target.config, data, self.__dispatcher, target.status, target.renderer).emit(event, alert)
+
+    def __notify_summary(self, event, summary):
+        for target in self.__targets:
+            Payload.create(target.config, summary, self.__dispatcher, renderer=target.renderer).emit_summary(event)
+
+    def __report_period(self):
+        self.__notify(Event.PERIOD)
+
+    def __handle_deadline(self):
+        self.__notify(Event.DEADLINE)
+
+    def __handle_heartbeat(self):
+        '''Reports that the command is alive but silent, once per `heartbeat` seconds without output.'''
+        heartbeat = self.__config.heartbeat
+        streams = [stream for stream in (self.__stdout, self.__stderr) if stream] or [stream for stream in [self.__stdin] if stream]
+        idle = min((stream.idle for stream in streams), default=heartbeat)
+        if idle >= heartbeat:
+            self.__notify(Event.HEARTBEAT)
+            idle = 0
+        self.__scheduler.call_later(heartbeat - idle, self.__handle_heartbeat)
 
     def __handle_signal(self, *args):
-        payload = Payload.create(self.__config, self.data)
-        payload.emit_signal()
+        self.__notify(Event.SIGNAL)
+
+    def __handle_alert(self, alert):
+        self.__notify(Event.ALERT, alert)
 
     def __handle_timeout(self):
-        assert self.__timeout_timer
         self.__shutdown()
         self.__exitcode = codes.EXIT_TIMEOUT
         print('Discordify enforced timeout after '+str(self.__config.timeout)+' second(s).', file=sys.stderr)
-        payload = Payload.create(self.__config, self.data)
-        payload.emit_timeout()
+        self.__notify(Event.TIMEOUT)
 
     def handle_interrupt(self):
         self.__shutdown()
         self.__exitcode = codes.EXIT_INTERRUPTED
-        payload = Payload.create(self.__config, self.data)
-        payload.emit_interrupt()
+        self.__notify(Event.INTERRUPT)
+        self.__dispatcher.close(self.__config.flush_timeout)
+        self.__dump_stats()
+        self.__cleanup()
 
     def kill(self):
         assert self.__process != None
@@ -194,12 +408,19 @@ class Command:
         self.__process.terminate()
         self.__stop_threads()
 
-    def __shutdown(self):
+    def __shutdown(self, *args):
         self.__terminate = True
         self.__end_time = time.time()
+        if self.__engine:
+            self.__engine.stop()
         if self.__process:
             self.terminate()
             if not self.__process.poll():
                 self.kill()
 
-        close(0)
+        if not self.__standalone:
+            return
+        try:
+            close(0)
+        except OSError:
+            pass
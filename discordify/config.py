@@ -1,21 +1,64 @@
 import getopt
 import json
+import re
 import sys
-from distutils.util import strtobool
 from functools import partial
-from getpass import getuser
 # required to get the HOME folder
 from pathlib import Path
-from socket import gethostname
 
 from discordify.command import Command
-from discordify.utils import compute_gravatar_url
+from discordify.render import compile_templates
+from discordify.utils import compute_gravatar_url, hostname, username
 
 TOOL_NAME = 'discordify'
 GLOBAL_CONFIG = '/etc/{}.conf'.format(TOOL_NAME)
 LOCAL_CONFIG = '{home}/.{tool}.conf'.format(home=Path.home(), tool=TOOL_NAME)
 
 
+def parse_patterns(value):
+    patterns = value if isinstance(value, list) else [value]
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as err:
+            raise getopt.GetoptError('Invalid alert pattern "{}": {}'.format(pattern, err))
+    return patterns
+
+
+def parse_templates(value):
+    try:
+        templates = json.loads(value) if isinstance(value, str) else value
+        if not isinstance(templates, dict) or not all(isinstance(keys, dict) for keys in templates.values()):
+            raise ValueError('Expected an object of events, e.g. {"final": {"title": "..."}}.')
+        compile_templates(templates)
+    except ValueError as err:
+        raise getopt.GetoptError('Invalid templates: {}'.format(err))
+    return templates
+
+
+def parse_targets(value):
+    try:
+        targets = json.loads(value) if isinstance(value, str) else value
+    except ValueError as err:
+        raise getopt.GetoptError('Invalid targets: {}'.format(err))
+    if not isinstance(targets, list) or not all(isinstance(target, dict) for target in targets):
+        raise getopt.GetoptError('Invalid targets: expected a list of objects, e.g. [{"webhook": "...", "format": "slack"}].')
+    return targets
+
+
+def parse_flag(value):
+    '''Flags of the config files and targets are JSON booleans, which arrive here as "True" and "False".'''
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'off')
+    return bool(value)
+
+
+def parse_choice(choices, value):
+    if value not in choices:
+        raise getopt.GetoptError('Invalid value "{}", expected one of {}.'.format(value, ', '.join(choices)))
+    return value
+
+
 class Option:
 
     def __init__(self, long_opt, required=False, takes_arg=False, **kwargs):
@@ -30,7 +73,7 @@ class Option:
         self.description = kwargs.get('description')
         self.example = kwargs.get('example')
 
-        self.__parse = kwargs.get('parse')
+        self.__parse = kwargs.get('parse', parse_flag if not takes_arg else None)
 
     def __str__(self):
         string = '--' + self.long_opt
@@ -105,6 +148,20 @@ class Arguments:
                 description='Defines the webhook\'s endpoint in Slack/Discord.',
                 takes_arg=True,
                 required=True),
+            'targets': Option(
+                long_opt='targets',
+                description='Defines several webhooks to notify at once as JSON list. Every target sets its webhook and may override the formatting and delivery options, e.g. its format.',
+                takes_arg=True,
+                required=False,
+                example='--targets \'[{"webhook": "https://discord.com/api/webhooks/id/token"}, {"webhook": "https://hooks.slack.com/services/id", "format": "slack"}]\'',
+                parse=parse_targets),
+            'format': Option(
+                long_opt='format',
+                description='Defines the format of the payloads: discord (embeds or, with --simple, messages), slack (Block Kit) or text.',
+                default='discord',
+                takes_arg=True,
+                required=False,
+                parse=partial(parse_choice, ['discord', 'slack', 'text'])),
             'title': Option(
                 long_opt='title',
                 description='Defines the title of the embed.',
@@ -144,7 +201,7 @@ class Arguments:
             'user_email': Option(
                 long_opt='user_email',
                 description='Defines the email of the user in the embed.',
-                default='{user}@{host}'.format(user=getuser(), host=gethostname()),
+                default='{user}@{host}'.format(user=username(), host=hostname()),
                 takes_arg=True,
                 required=True
             ),
@@ -225,20 +282,42 @@ class Arguments:
                 required=False,
                 parse=lambda s: int(s, 0)
             ),
+            'timeout_warning': Option(
+                long_opt='timeout_warning',
+                description='Defines the share of the timeout after which a warning is sent, 0 disables it.',
+                default='0.8',
+                takes_arg=True,
+                required=False,
+                parse=float
+            ),
+            'heartbeat': Option(
+                long_opt='heartbeat',
+                description='Defines the time (in seconds) without any output after which a heartbeat is sent, and sent again.',
+                takes_arg=True,
+                required=False,
+                parse=float
+            ),
             'footer': Option(
                 long_opt='footer',
                 description='Defines the footnote of the embed.',
-                default='via {}@{}'.format(getuser(), gethostname()),
+                default='via {}@{}'.format(username(), hostname()),
                 takes_arg=True,
                 required=False
             ),
             'system_stats': Option(
                 long_opt='system_stats',
-                description='Enable stats about the system.',
-                default='False',
+                description='Enable stats about the CPU, memory and I/O usage of the process and its children.',
                 takes_arg=False,
                 required=False
             ),
+            'sample_interval': Option(
+                long_opt='sample_interval',
+                description='Defines the interval (in seconds) in which the system stats are sampled.',
+                default='5',
+                takes_arg=True,
+                required=False,
+                parse=float
+            ),
             'simple': Option(
                 long_opt='simple',
                 short_opt='s',
@@ -246,6 +325,14 @@ class Arguments:
                 takes_arg=False,
                 required=False
             ),
+            'templates': Option(
+                long_opt='templates',
+                description='Overrides the title, description or content of the reports per event (final, timeout, interrupt, signal, period, alert, deadline, heartbeat) as JSON. Templates are format strings, e.g. {command}, {hostname} or {runtime}.',
+                takes_arg=True,
+                required=False,
+                example='--templates \'{"final": {"title": "{command} finished on {hostname}"}}\'',
+                parse=parse_templates
+            ),
             'buffer_size': Option(
                 long_opt='buffer_size',
                 description='Defines the size (number of lines) of the stdin/stdout/stderr buffers.',
@@ -253,6 +340,213 @@ class Arguments:
                 takes_arg=True,
                 required=False,
                 parse=lambda s: int(s, 0)
+            ),
+            'buffer_bytes': Option(
+                long_opt='buffer_bytes',
+                description='Defines the size (in bytes) of each of the stdin/stdout/stderr buffers.',
+                default='4096',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'line_length': Option(
+                long_opt='line_length',
+                description='Defines the length (in bytes) after which buffered lines are truncated.',
+                default='50',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'spool_dir': Option(
+                long_opt='spool_dir',
+                description='Defines a directory to keep the complete stdin/stdout/stderr of each run in.',
+                takes_arg=True,
+                required=False
+            ),
+            'spool_size': Option(
+                long_opt='spool_size',
+                description='Defines the size (in bytes) after which a spooled log is rotated.',
+                default=str(64 << 20),
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'spool_segments': Option(
+                long_opt='spool_segments',
+                description='Defines how many segments (including the current one) of a spooled log are kept.',
+                default='4',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'spool_compress': Option(
+                long_opt='spool_compress',
+                description='Compresses rotated segments of the spooled logs with gzip.',
+                takes_arg=False,
+                required=False
+            ),
+            'attach_logs': Option(
+                long_opt='attach_logs',
+                description='Attaches the complete stdout/stderr to final, timeout and interrupt reports.',
+                takes_arg=False,
+                required=False
+            ),
+            'attachment_limit': Option(
+                long_opt='attachment_limit',
+                description='Defines the size (in bytes) of the attachments of a message, larger logs are compressed or split.',
+                default=str(8 << 20),
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'outbox': Option(
+                long_opt='outbox',
+                description='Defines the journal that notifications which could not be delivered are kept in (default: ~/.local/state/discordify/outbox.jsonl).',
+                takes_arg=True,
+                required=False
+            ),
+            'flush_outbox': Option(
+                long_opt='flush_outbox',
+                description='Replays the notifications kept in the outbox and exits.',
+                takes_arg=False,
+                required=False
+            ),
+            'stats': Option(
+                long_opt='stats',
+                description='Collects statistics of discordify itself (time spent on the output, notifications, retries) and writes them as JSON to a file, or stderr for "-", on SIGUSR2 and at exit.',
+                takes_arg=True,
+                required=False
+            ),
+            'pty': Option(
+                long_opt='pty',
+                description='Runs the command with its output on a pseudo-terminal, so it is line buffered rather than written in blocks.',
+                takes_arg=False,
+                required=False
+            ),
+            'engine': Option(
+                long_opt='engine',
+                description='Defines how the process I/O is handled, either "threads" or a single "select" event loop.',
+                default='threads',
+                takes_arg=True,
+                required=False,
+                parse=partial(parse_choice, ('threads', 'select'))
+            ),
+            'flush_timeout': Option(
+                long_opt='flush_timeout',
+                description='Defines how long (in seconds) to wait for pending notifications on exit.',
+                default='10',
+                takes_arg=True,
+                required=False,
+                parse=float
+            ),
+            'retries': Option(
+                long_opt='retries',
+                description='Defines how often a rate limited or failed notification is retried.',
+                default='3',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'rate_limit': Option(
+                long_opt='rate_limit',
+                description='Defines how many notifications (per minute) are sent to a webhook at most, 0 does not limit the rate.',
+                default='30',
+                takes_arg=True,
+                required=False,
+                parse=float
+            ),
+            'rate_burst': Option(
+                long_opt='rate_burst',
+                description='Defines how many notifications can be sent to a webhook in a burst.',
+                default='5',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'edit_in_place': Option(
+                long_opt='edit_in_place',
+                description='Posts a single status message per job and edits it on every update.',
+                takes_arg=False,
+                required=False
+            ),
+            'final_as_new': Option(
+                long_opt='final_as_new',
+                description='Posts the final report as a new message rather than editing the status message.',
+                takes_arg=False,
+                required=False
+            ),
+            'alert': Option(
+                long_opt='alert',
+                short_opt='a',
+                description='Defines a regular expression that sends an alert when it matches a line of output (a list in the config file).',
+                takes_arg=True,
+                required=False,
+                parse=parse_patterns,
+                example='--alert \'Traceback|CUDA error|Out of memory\''
+            ),
+            'alert_context': Option(
+                long_opt='alert_context',
+                description='Defines the number of lines before and after a match included in an alert.',
+                default='3',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'alert_debounce': Option(
+                long_opt='alert_debounce',
+                description='Defines the time (in seconds) during which an alert pattern does not fire again.',
+                default='60',
+                takes_arg=True,
+                required=False,
+                parse=float
+            ),
+            'daemon_socket': Option(
+                long_opt='daemon_socket',
+                description='Defines the socket of a local discordify daemon to hand notifications to (python -m discordify.daemon).',
+                takes_arg=True,
+                required=False
+            ),
+            'batch': Option(
+                long_opt='batch',
+                description='Runs the commands of a file (or "-" for stdin), one per line, and reports on all of them at once. The commands are split like in a shell but not run by one.',
+                takes_arg=True,
+                required=False,
+                example='--batch jobs.txt --jobs 8 --periodic 600'
+            ),
+            'group': Option(
+                long_opt='group',
+                description='Keeps the record of the run in a group (e.g. the tasks of an array job) instead of reporting it, see --digest and --group_size.',
+                takes_arg=True,
+                required=False,
+                example='--group "$SLURM_ARRAY_JOB_ID" --group_size 500'
+            ),
+            'group_size': Option(
+                long_opt='group_size',
+                description='Defines the number of runs of a group, the run completing it sends the digest of all of them.',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
+            ),
+            'digest': Option(
+                long_opt='digest',
+                description='Sends the digest of the runs kept in a group so far and exits.',
+                takes_arg=True,
+                required=False
+            ),
+            'digest_dir': Option(
+                long_opt='digest_dir',
+                description='Defines the directory the records of the groups are kept in, shared by all nodes (default: ~/.local/state/discordify/digests).',
+                takes_arg=True,
+                required=False
+            ),
+            'jobs': Option(
+                long_opt='jobs',
+                short_opt='j',
+                description='Defines how many commands of a batch run at the same time.',
+                default='4',
+                takes_arg=True,
+                required=False,
+                parse=lambda s: int(s, 0)
             )}
 
         self.extend_config()
@@ -278,14 +572,18 @@ class Arguments:
             if option.contained(dopts):
                 config.config[option.long_opt] = option.process(dopts)
             elif option.long_opt in config.config:
-                config.config[option.long_opt] = option.parse(str(config.config[option.long_opt]))
-                pass
+                value = config.config[option.long_opt]
+                config.config[option.long_opt] = option.parse(value if isinstance(value, (list, dict)) else str(value))
             elif option.default:
                 dopts['--'+option.long_opt] = option.default
                 config.config[option.long_opt] = option.process(dopts)
             elif option.required:
                 missing_options.append(option.long_opt)
 
+        if (config.targets or config.flush_outbox) and 'webhook' in missing_options:
+            # every target defines its own webhook, so does every journaled notification
+            missing_options.remove('webhook')
+
         if len(missing_options) > 0:
             print(config)
             raise getopt.GetoptError('Missing required options "{}".\n'.format(','.join(missing_options)))
@@ -293,8 +591,27 @@ class Arguments:
         if getattr(config, "user_email") and not getattr(config, 'user_icon'):
             config.config['user_icon'] = compute_gravatar_url(getattr(config, "user_email"))
 
+        if not config.flush_outbox:
+            config.config['targets'] = self.__targets(config)
+
         return Command(config, args)
 
+    def __targets(self, config):
+        '''Derives the configuration of every target, a single webhook is a single target.'''
+        targets = []
+        for target in config.targets or [{}]:
+            overrides = {}
+            for name, value in target.items():
+                option = self.options.get(name)
+                if not option or name in ('help', 'targets'):
+                    raise getopt.GetoptError('Invalid option "{}" in targets.'.format(name))
+                overrides[name] = option.parse(value if isinstance(value, (list, dict)) else str(value))
+            derived = config.derive(overrides)
+            if not derived.webhook:
+                raise getopt.GetoptError('Missing webhook of target {}.'.format(len(targets) + 1))
+            targets.append(derived)
+        return targets
+
     def extend_config(self):
         for name in self.options:
             setattr(Config, name, property(lambda x, name=name: x.config[name] if name in x.config else None))
@@ -338,5 +655,12 @@ class Config:
             except Exception:
                 pass
 
+    def derive(self, overrides):
+        '''Returns a copy of the configuration with some options overridden.'''
+        derived = Config.__new__(Config)
+        derived.config = dict(self.config, **overrides)
+        derived.config.pop('targets', None)
+        return derived
+
     def __repr__(self):
-        return json.dumps(self.config, sort_keys=True, indent=4)
+        return json.dumps(self.config, sort_keys=True, indent=4, default=repr)
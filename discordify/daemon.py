@@ -0,0 +1,236 @@
+import getopt
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+import threading
+import time
+
+import discordify.exit_codes as codes
+import discordify.ratelimit as ratelimit
+import discordify.transport as transport
+from discordify.outbox import Outbox, outbox_path
+from discordify.serialize import dumps
+
+# Discord accepts up to 10 embeds and 6000 characters of embed text per message
+MAX_EMBEDS = 10
+MAX_EMBED_SIZE = 6000
+
+
+def socket_path():
+    '''Returns the default socket of the daemon for the current user.'''
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'discordify.sock')
+    # in a directory of its own, /tmp is shared with every other user
+    return '/tmp/discordify-{}/discordify.sock'.format(os.getuid())
+
+
+def private(path):
+    '''
+    Returns whether `path` and the directory holding it belong to the current
+    user and no one else has access, so nobody else can listen at `path`.
+    '''
+    try:
+        directory = os.stat(os.path.dirname(os.path.abspath(path)))
+        status = os.lstat(path)
+    except OSError:
+        return False
+    return (directory.st_uid == os.getuid() and not directory.st_mode & 0o077 and
+            stat.S_ISSOCK(status.st_mode) and status.st_uid == os.getuid() and not status.st_mode & 0o077)
+
+
+def submit(path, webhook, payload):
+    '''
+    Hands a payload to the daemon listening at `path`. Returns False if no
+    daemon is running or the socket is not private to the current user (the
+    payload carries the token of the webhook), the caller is expected to post
+    the payload itself.
+    '''
+    if not private(path):
+        return False
+    message = dumps({'webhook': webhook, 'payload': payload})
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            client.sendall(message)
+    except OSError:
+        return False
+    return True
+
+
+def merge(payloads):
+    '''
+    Merges embed-only payloads into messages with as many embeds as Discord
+    accepts, keeping their order. Other payloads are passed on as they are.
+    '''
+    messages = []
+    embeds, size = [], 0
+    for payload in payloads:
+        if set(payload) != {'embeds'}:
+            if embeds:
+                messages.append({'embeds': embeds})
+                embeds, size = [], 0
+            messages.append(payload)
+            continue
+        for embed in payload['embeds']:
+            embed_size = len(dumps(embed))
+            if embeds and (len(embeds) == MAX_EMBEDS or size + embed_size > MAX_EMBED_SIZE):
+                messages.append({'embeds': embeds})
+                embeds, size = [], 0
+            embeds.append(embed)
+            size += embed_size
+    if embeds:
+        messages.append({'embeds': embeds})
+    return messages
+
+
+class Daemon:
+    '''
+    Receives payloads from many discordify processes over a Unix socket and
+    posts them through one connection pool and rate limiter per webhook.
+    Payloads arriving within `linger` seconds are merged into multi-embed
+    messages.
+    '''
+
+    def __init__(self, path, linger=1.0, rate_limit=30, rate_burst=5, retries=3, outbox=None):
+        self.__path = path
+        self.__outbox = Outbox(outbox or outbox_path())
+        self.__linger = linger
+        self.__rate_limit = rate_limit
+        self.__rate_burst = rate_burst
+        self.__retries = retries
+        self.__pending = {}
+        self.__senders = {}
+        self.__condition = threading.Condition()
+        self.__server = None
+
+    def serve(self):
+        self.__server = self.__bind()
+        threading.Thread(target=self.__flush, name='FLUSH', daemon=True).start()
+        try:
+            while True:
+                connection, _ = self.__server.accept()
+                threading.Thread(target=self.__receive, args=(connection,), daemon=True).start()
+        finally:
+            self.__server.close()
+            os.unlink(self.__path)
+
+    def __bind(self):
+        directory = os.path.dirname(os.path.abspath(self.__path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        status = os.stat(directory)
+        if status.st_uid != os.getuid() or status.st_mode & 0o077:
+            raise RuntimeError('{} must belong to the current user and be private (mode 0700).'.format(directory))
+
+        if os.path.exists(self.__path):
+            if submit(self.__path, None, None):
+                raise RuntimeError('A daemon is already listening at {}.'.format(self.__path))
+            # left behind by a daemon that did not shut down cleanly
+            os.unlink(self.__path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            server.bind(self.__path)
+        finally:
+            os.umask(umask)
+        server.listen(128)
+        return server
+
+    def __receive(self, connection):
+        chunks = []
+        with connection:
+            while True:
+                chunk = connection.recv(1 << 16)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+
+        try:
+            message = json.loads(b''.join(chunks))
+        except ValueError:
+            return
+        if not message.get('webhook') or not message.get('payload'):
+            return
+
+        with self.__condition:
+            self.__pending.setdefault(message['webhook'], (time.monotonic(), []))[1].append(message['payload'])
+            self.__condition.notify()
+
+    def __flush(self):
+        while True:
+            with self.__condition:
+                while not self.__pending:
+                    self.__condition.wait()
+                # give a burst the chance to arrive before sending it
+                due = min(arrival for arrival, _ in self.__pending.values()) + self.__linger
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.__condition.wait(delay)
+                    continue
+                ready = {webhook: payloads for webhook, (arrival, payloads) in self.__pending.items() if arrival + self.__linger <= time.monotonic()}
+                for webhook in ready:
+                    del self.__pending[webhook]
+
+            for webhook, payloads in ready.items():
+                self.__senders.setdefault(webhook, threading.Lock())
+                threading.Thread(target=self.__send, args=(webhook, payloads), daemon=True).start()
+
+    def __send(self, webhook, payloads):
+        limiter = ratelimit.bucket(webhook, self.__rate_limit, self.__rate_burst)
+        headers = {'Content-Type': 'application/json'}
+        # batches of the same webhook are sent one after the other to keep their order
+        with self.__senders[webhook]:
+            messages = merge(payloads)
+            for index, message in enumerate(messages):
+                try:
+                    result = transport.post(webhook, data=dumps(message), headers=headers, retries=self.__retries, limiter=limiter)
+                except Exception as err:
+                    print('Failed to post notification: {}'.format(err), file=sys.stderr)
+                    result = None
+                if result is not None and result.status_code < 400:
+                    continue
+                if result is not None:
+                    print('Post Failed, Error {}'.format(result.status_code), file=sys.stderr)
+                if result is None or result.status_code in transport.RETRY_STATUS:
+                    # keep this and the following messages, in order, for a later replay
+                    for kept in messages[index:]:
+                        self.__outbox.append(webhook, kept)
+                    break
+
+
+def usage():
+    print('USAGE: python -m discordify.daemon [--socket PATH] [--linger SECONDS] [--rate_limit PER_MINUTE] [--rate_burst COUNT] [--outbox PATH]')
+
+
+def main():
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'h', ['help', 'socket=', 'linger=', 'rate_limit=', 'rate_burst=', 'outbox='])
+    except getopt.GetoptError as err:
+        print(err, file=sys.stderr)
+        usage()
+        sys.exit(codes.EXIT_INVALID_ARGS)
+
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts:
+        usage()
+        sys.exit(codes.EXIT_OK)
+
+    daemon = Daemon(opts.get('--socket', socket_path()),
+                    linger=float(opts.get('--linger', 1.0)),
+                    rate_limit=float(opts.get('--rate_limit', 30)),
+                    rate_burst=int(opts.get('--rate_burst', 5)),
+                    outbox=opts.get('--outbox'))
+    # terminate through SystemExit, so the socket is cleaned up
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(codes.EXIT_OK))
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,14 @@
 import datetime
 import time
-from getpass import getuser
 from os import getpgid
-from socket import gethostname
 from discordify.mode import Mode
+from discordify.utils import hostname, username
 
 
 class Data:
     '''Holds the data to be emitted as a payload via the webhook.'''
 
-    def __init__(self, arguments, pid: int, start_time, end_time, mode: Mode, stdin_lines, stdout_lines, stderr_lines, stdin_buffer, stdout_buffer, stderr_buffer, returncode):
+    def __init__(self, arguments, pid: int, start_time, end_time, mode: Mode, stdin_lines, stdout_lines, stderr_lines, stdin_buffer, stdout_buffer, stderr_buffer, returncode, coalesced=0, suppressed=0, resources=None, throughput=None, spool_dir=None, logs=None):
         self.__command = arguments[0] if arguments and len(arguments) > 0 else None
         self.__arguments = arguments[1:] if arguments and len(arguments) > 1 else None
         self.__pid = pid
@@ -23,8 +22,14 @@ class Data:
         self.__stdout_buffer = stdout_buffer
         self.__stderr_buffer = stderr_buffer
         self.__returncode = returncode
-        self.__username = getuser()
-        self.__hostname = gethostname()
+        self.__coalesced = coalesced
+        self.__suppressed = suppressed
+        self.__resources = resources
+        self.__throughput = throughput or {}
+        self.__spool_dir = spool_dir
+        self.__logs = logs or {}
+        self.__username = username()
+        self.__hostname = hostname()
 
     @property
     def argument(self):
@@ -58,6 +63,41 @@ class Data:
     def stderr_buffer(self):
         return self.__stderr_buffer
 
+    @property
+    def coalesced(self):
+        return self.__coalesced
+
+    @property
+    def suppressed(self):
+        '''Number of alerts that were debounced.'''
+        return self.__suppressed
+
+    @property
+    def resources(self):
+        '''Resource usage of the process tree (see Sampler.summary), None if not sampled.'''
+        return self.__resources
+
+    @property
+    def throughput(self):
+        '''Counters and rates per stream name (see Meter.snapshot).'''
+        return self.__throughput
+
+    @property
+    def spool_dir(self):
+        '''Directory holding the complete output, None if it is not spooled.'''
+        return self.__spool_dir
+
+    @property
+    def logs(self):
+        '''The spools holding the complete output, by stream name.'''
+        return self.__logs
+
+    @property
+    def fingerprint(self):
+        '''Identifies the reported output and state, ignoring the time passed.'''
+        return hash((self.__stdin_lines, self.__stdout_lines, self.__stderr_lines,
+                     self.__stdin_buffer, self.__stdout_buffer, self.__stderr_buffer, self.__returncode))
+
     @property
     def returncode(self):
         return self.__returncode if self.__returncode is not None else '<unavailable>'
@@ -66,6 +106,16 @@ class Data:
     def runtime(self):
         return str(datetime.timedelta(seconds=self.__end_time - self.__start_time))
 
+    @property
+    def duration(self):
+        '''Run time in seconds.'''
+        return self.__end_time - self.__start_time
+
+    @property
+    def started(self):
+        '''Start time as Unix timestamp.'''
+        return self.__start_time
+
     @property
     def start_time(self):
         return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.__start_time))
@@ -94,6 +144,15 @@ class Data:
             assert Mode.SINK == self.__mode
             return '<discordify SINK>'
 
+    @property
+    def command_line(self):
+        '''The command with its arguments, quoted for a shell.'''
+        from discordify.record import command_line
+
+        if not self.__command:
+            return self.command
+        return command_line([self.__command] + (self.__arguments or []))
+
     @property
     def hostname(self):
         return self.__hostname
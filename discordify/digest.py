@@ -0,0 +1,99 @@
+import os
+
+from discordify.record import Record, Summary
+from discordify.serialize import dumps, loads
+from discordify.utils import hostname
+
+# environment variables holding the index of a task in an array job (SLURM, PBS Pro/Torque)
+TASK_VARIABLES = ('SLURM_ARRAY_TASK_ID', 'PBS_ARRAY_INDEX', 'PBS_ARRAYID')
+# marks a group whose digest was sent
+CLAIM = '.digest'
+
+
+def digest_dir():
+    '''Returns the default directory of the digests of the current user.'''
+    state_dir = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(state_dir, 'discordify', 'digests')
+
+
+def task_id():
+    '''The index of this task in its array job, the process id outside of one.'''
+    for variable in TASK_VARIABLES:
+        if os.environ.get(variable):
+            return os.environ[variable]
+    return str(os.getpid())
+
+
+class Digest:
+    '''
+    The records of a group of independent runs (e.g. the tasks of an array
+    job), one small file per run in a shared directory. Files are written
+    under a hidden name and renamed, so readers never see partial records.
+    '''
+
+    def __init__(self, directory, group):
+        if not group or os.sep in group or group.startswith('.'):
+            raise ValueError('Invalid group "{}".'.format(group))
+        self.__group = group
+        self.__path = os.path.join(directory, group)
+
+    @property
+    def group(self):
+        return self.__group
+
+    @property
+    def path(self):
+        return self.__path
+
+    def write(self, record):
+        '''Keeps the record of a run, returns its file.'''
+        os.makedirs(self.__path, mode=0o700, exist_ok=True)
+        name = '{}-{}-{}.json'.format(record.id, hostname(), os.getpid())
+        path = os.path.join(self.__path, name)
+        temporary = os.path.join(self.__path, '.' + name)
+        with open(temporary, 'wb') as file:
+            file.write(dumps(record.to_dict()))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        return path
+
+    def __files(self):
+        try:
+            with os.scandir(self.__path) as entries:
+                return [entry.path for entry in entries if entry.name.endswith('.json') and not entry.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+    @property
+    def size(self):
+        '''Number of records written so far.'''
+        return len(self.__files())
+
+    def records(self):
+        '''Loads all records, ordered by task id.'''
+        records = []
+        for path in self.__files():
+            try:
+                with open(path, 'rb') as file:
+                    records.append(Record.from_dict(loads(file.read())))
+            except (OSError, ValueError, TypeError):
+                # removed meanwhile or not a record
+                continue
+        records.sort(key=lambda record: (not record.id.isdigit(), int(record.id) if record.id.isdigit() else 0, record.id))
+        return records
+
+    def summary(self, total=None):
+        records = self.records()
+        return Summary(records, max(total or 0, len(records)), self.__group)
+
+    def claim(self):
+        '''
+        Claims sending the digest of the group, exactly one of the runs that
+        try succeeds (also on NFS, which honors O_EXCL since v3).
+        '''
+        try:
+            os.close(os.open(os.path.join(self.__path, CLAIM), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        except FileExistsError:
+            return False
+        return True
@@ -0,0 +1,120 @@
+import heapq
+import itertools
+import sys
+import threading
+import time
+
+import discordify.stats as stats
+from discordify.event import Event
+
+
+class Dispatcher:
+    '''
+    Delivers payloads from background threads, so neither signal handlers,
+    timers nor the shutdown path wait on a slow webhook. Every webhook has a
+    queue and a thread of its own, so the targets are notified concurrently
+    and a report takes as long as the slowest of them. Queued payloads are
+    sent by priority of their event, oldest first. A queued periodic update is
+    replaced by a newer one and dropped once a terminal report is queued,
+    terminal reports themselves are never dropped.
+    '''
+
+    def __init__(self):
+        # queue per webhook
+        self.__queues = {}
+        # reentrant, a signal handler may submit while the main thread holds the lock
+        self.__condition = threading.Condition(threading.RLock())
+        self.__sequence = itertools.count()
+        self.__threads = []
+        self.__closed = False
+        # payloads being sent, by thread
+        self.__sending = {}
+        self.__coalesced = 0
+        self.__failed = 0
+
+    def submit(self, payload, event):
+        with self.__condition:
+            if self.__closed:
+                # too late to be sent, a terminal report is kept for a later replay
+                if event.priority == 0:
+                    payload.defer()
+                return
+            queue = self.__queues.get(payload.config.webhook)
+            if queue is None:
+                queue = self.__queues[payload.config.webhook] = []
+                thread = threading.Thread(target=self.__run, args=(queue,), name='DISPATCH', daemon=True)
+                self.__threads.append(thread)
+                thread.start()
+            if event == Event.PERIOD or event.priority == 0:
+                self.__discard(queue)
+            heapq.heappush(queue, (event.priority, next(self.__sequence), event, payload))
+            self.__condition.notify_all()
+            if stats.current:
+                stats.current.peak('dispatch.queue_depth', len(queue))
+
+    def __discard(self, queue):
+        '''Removes the queued periodic updates.'''
+        kept = [entry for entry in queue if entry[2] != Event.PERIOD]
+        if len(kept) != len(queue):
+            self.__coalesced += len(queue) - len(kept)
+            heapq.heapify(kept)
+            queue[:] = kept
+
+    @property
+    def coalesced(self):
+        '''Number of periodic updates that were replaced or dropped before being sent.'''
+        return self.__coalesced
+
+    @property
+    def pending(self):
+        return sum(len(queue) for queue in self.__queues.values())
+
+    def close(self, timeout=None):
+        '''
+        Stops accepting payloads and waits at most `timeout` seconds for the queues
+        to drain. Payloads still queued are kept in the outbox. Returns the number
+        of payloads that could not be delivered, including those that failed.
+        '''
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in self.__threads:
+            thread.join(max(0, deadline - time.monotonic()) if deadline is not None else None)
+
+        with self.__condition:
+            # a payload still being sent is lost with the process, better deliver it twice than never
+            undelivered = list(self.__sending.values())
+            undelivered += [payload for queue in self.__queues.values() for _, _, _, payload in sorted(queue)]
+            for queue in self.__queues.values():
+                queue.clear()
+
+        # what did not make it in time is kept for a later replay
+        for payload in undelivered:
+            payload.defer()
+
+        if undelivered:
+            print('Discordify could not deliver {} notification(s) in time.'.format(len(undelivered)), file=sys.stderr)
+        return len(undelivered) + self.__failed
+
+    def __run(self, queue):
+        while True:
+            with self.__condition:
+                while not queue and not self.__closed:
+                    self.__condition.wait()
+                if not queue:
+                    return
+                _, _, _, payload = heapq.heappop(queue)
+                self.__sending[threading.get_ident()] = payload
+
+            delivered = False
+            try:
+                delivered = payload.send()
+            except Exception as err:
+                print('Discordify failed to post notification: {}'.format(err), file=sys.stderr)
+            finally:
+                with self.__condition:
+                    del self.__sending[threading.get_ident()]
+                    if not delivered:
+                        self.__failed += 1
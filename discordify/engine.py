@@ -0,0 +1,161 @@
+import os
+import selectors
+
+from discordify.scheduler import Scheduler
+from discordify.stream import CHUNK_SIZE
+
+# interval to poll for the child's exit on platforms without pidfd support
+POLL_INTERVAL = 0.1
+
+
+class SelectorEngine:
+    '''
+    Runs the I/O of a wrapped process in a single loop: the output pipes, the
+    forwarding of stdin, the timers and the exit of the child are all
+    multiplexed with `selectors`, so no helper threads are needed. The timers
+    are those of `scheduler`, which the loop drives.
+    '''
+
+    def __init__(self, scheduler=None):
+        self.__selector = selectors.DefaultSelector()
+        # an empty scheduler is falsy, it may still be given callbacks while the loop runs
+        self.__scheduler = scheduler if scheduler is not None else Scheduler()
+        self.__pending = {}
+        # regular files cannot be polled, they are always ready for reading
+        self.__files = {}
+        self.__process = None
+        self.__pidfd = None
+        self.__stopped = False
+
+    def add_stream(self, stream):
+        '''Forwards the stream's source to its sink until EOF.'''
+        self.__register(stream.source.fileno(), selectors.EVENT_READ, (self.__on_output, stream))
+
+    def add_inlet(self, stream, target):
+        '''
+        Forwards the stream's source into the child's stdin (`target`). Writes are
+        non-blocking, while the child is not consuming its input the source is not
+        read either.
+        '''
+        os.set_blocking(target.fileno(), False)
+        self.__pending[stream] = [target, None]
+        self.__register(stream.source.fileno(), selectors.EVENT_READ, (self.__on_input, stream))
+
+    def stop(self):
+        self.__stopped = True
+
+    def run(self, process=None):
+        '''Runs the loop until all streams are drained and the process has exited.'''
+        self.__process = process
+        if process is not None and hasattr(os, 'pidfd_open'):
+            try:
+                self.__pidfd = os.pidfd_open(process.pid)
+                self.__selector.register(self.__pidfd, selectors.EVENT_READ, (self.__on_exit, None))
+            except OSError:
+                self.__pidfd = None
+
+        try:
+            while not self.__stopped and self.__active():
+                ready = self.__selector.select(0 if self.__files else self.__next_timeout())
+                for key in [key for key, _ in ready] + list(self.__files.values()):
+                    if self.__registered(key.fd):
+                        handler, stream = key.data
+                        handler(key, stream)
+                self.__scheduler.fire()
+        finally:
+            for fd in list(self.__selector.get_map()) + list(self.__files):
+                self.__unregister(fd)
+            self.__selector.close()
+
+    def __active(self):
+        if self.__process is not None and self.__process.poll() is None:
+            return True
+        # keep going until the output of the (exited) child is drained
+        return bool(self.__files) or any(fd != self.__pidfd for fd in self.__selector.get_map())
+
+    def __next_timeout(self):
+        timeout = self.__scheduler.timeout()
+        if self.__process is not None and self.__pidfd is None and self.__process.returncode is None:
+            timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+        return timeout
+
+    def __register(self, fd, events, data):
+        try:
+            self.__selector.register(fd, events, data)
+        except PermissionError:
+            self.__files[fd] = selectors.SelectorKey(fd, fd, events, data)
+
+    def __registered(self, fd):
+        return fd in self.__files or self.__selector.get_map().get(fd) is not None
+
+    def __unregister(self, fd):
+        try:
+            self.__files.pop(fd, None) or self.__selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+        if fd == self.__pidfd:
+            os.close(fd)
+            self.__pidfd = None
+
+    def __on_exit(self, key, _):
+        self.__process.poll()
+        self.__unregister(key.fd)
+
+    def __on_output(self, key, stream):
+        try:
+            chunk = os.read(key.fd, CHUNK_SIZE)
+        except OSError:
+            chunk = b''
+
+        if chunk:
+            stream.feed(chunk)
+        else:
+            self.__unregister(key.fd)
+            stream.close()
+
+    def __on_input(self, key, stream):
+        target = self.__pending[stream]
+        try:
+            chunk = os.read(key.fd, CHUNK_SIZE)
+        except OSError:
+            chunk = b''
+
+        if not chunk:
+            self.__close_inlet(stream)
+            return
+
+        stream.tap(chunk)
+        target[1] = memoryview(chunk)
+        if not self.__drain(stream) and stream in self.__pending:
+            # backpressure: stop reading the source until the child caught up
+            self.__unregister(key.fd)
+            self.__register(target[0].fileno(), selectors.EVENT_WRITE, (self.__on_writable, stream))
+
+    def __on_writable(self, key, stream):
+        if self.__drain(stream) and stream in self.__pending:
+            self.__unregister(key.fd)
+            self.__register(stream.source.fileno(), selectors.EVENT_READ, (self.__on_input, stream))
+
+    def __drain(self, stream):
+        '''Writes as much pending input as possible, returns whether everything was written.'''
+        target = self.__pending[stream]
+        try:
+            while target[1]:
+                target[1] = target[1][os.write(target[0].fileno(), target[1]):]
+        except BlockingIOError:
+            return False
+        except OSError:
+            # the child closed its stdin, there is nobody left to forward to
+            self.__close_inlet(stream)
+            return False
+        return True
+
+    def __close_inlet(self, stream):
+        target, _ = self.__pending.pop(stream)
+        for fd in (stream.source.fileno(), target.fileno()):
+            self.__unregister(fd)
+        stream.close()
+        try:
+            target.close()
+        except OSError:
+            pass
@@ -0,0 +1,21 @@
+from enum import Enum
+
+
+class Event(Enum):
+    FINAL = 1
+    TIMEOUT = 2
+    INTERRUPT = 3
+    SIGNAL = 4
+    PERIOD = 5
+    ALERT = 6
+    DEADLINE = 7
+    HEARTBEAT = 8
+
+    @property
+    def priority(self):
+        '''Lower values are delivered first, terminal reports always preempt updates.'''
+        if self in (Event.FINAL, Event.TIMEOUT, Event.INTERRUPT):
+            return 0
+        if self in (Event.SIGNAL, Event.ALERT, Event.DEADLINE):
+            return 1
+        return 2
@@ -3,3 +3,5 @@ EXIT_INVALID_ARGS = 0x01
 EXIT_INVALID_CONFIG = 0x02
 EXIT_INTERRUPTED = 0x03
 EXIT_TIMEOUT = 0x04
+EXIT_UNDELIVERED = 0x05
+EXIT_BATCH_FAILED = 0x06
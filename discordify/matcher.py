@@ -0,0 +1,213 @@
+import re
+import threading
+import time
+from collections import deque
+
+# context lines are truncated to this many bytes
+CONTEXT_LINE_LENGTH = 200
+# longest unterminated line kept to match across chunk boundaries
+MAX_PARTIAL = 1 << 16
+# time (in seconds) an alert waits for the lines following the match
+CONTEXT_GRACE = 2.0
+# inline flags at the start of a pattern, e.g. (?i)
+GLOBAL_FLAGS = re.compile(rb'^\(\?([imsx]+)\)')
+
+
+def scoped(pattern):
+    '''Wraps a pattern in a group, turning its leading inline flags into scoped ones.'''
+    flags = GLOBAL_FLAGS.match(pattern)
+    if flags:
+        return b'(?%s:%s)' % (flags.group(1), pattern[flags.end():])
+    return b'(?:%s)' % pattern
+
+
+class Alert:
+    '''A pattern that matched a line of output, with the lines around it.'''
+
+    def __init__(self, stream, pattern, line, context):
+        self.stream = stream
+        self.pattern = pattern
+        self.line = line
+        self.context = context
+
+
+class Matcher:
+    '''
+    Matches streamed output against all alert patterns with one combined
+    regular expression, so every chunk is scanned once no matter how many
+    patterns are configured. Only the lines it hits are checked against the
+    individual patterns. Alerts of the same pattern are debounced. Alerts
+    waiting for their context are flushed by the `scheduler`, without one
+    they wait until their lines are written or the stream is closed.
+    '''
+
+    def __init__(self, patterns, callback, context=3, debounce=60, scheduler=None):
+        self.__patterns = list(patterns)
+        self.__compiled = [re.compile(pattern.encode('utf-8')) for pattern in self.__patterns]
+        try:
+            # a plain alternation lets `re` skip ahead to the possible first characters,
+            # wrapping the patterns in groups would disable that optimization
+            self.__regex = re.compile(b'|'.join(regex.pattern for regex in self.__compiled))
+        except re.error:
+            # e.g. patterns with inline flags, which must stay at their start
+            self.__regex = re.compile(b'|'.join(scoped(regex.pattern) for regex in self.__compiled))
+        self.__callback = callback
+        self.__scheduler = scheduler
+        self.__context = context
+        self.__debounce = debounce
+        self.__fired = {}
+        self.__suppressed = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def regex(self):
+        return self.__regex
+
+    @property
+    def context(self):
+        return self.__context
+
+    @property
+    def suppressed(self):
+        '''Number of matches that did not raise an alert because of debouncing.'''
+        return self.__suppressed
+
+    def scanner(self, stream):
+        return Scanner(self, stream)
+
+    def accept(self, line):
+        '''Returns the patterns matching the line that are not debounced.'''
+        now = time.monotonic()
+        accepted = []
+        with self.__lock:
+            for pattern, regex in zip(self.__patterns, self.__compiled):
+                if not regex.search(line):
+                    continue
+                fired = self.__fired.get(pattern)
+                if fired is not None and now - fired < self.__debounce:
+                    self.__suppressed += 1
+                    continue
+                self.__fired[pattern] = now
+                accepted.append(pattern)
+        return accepted
+
+    def fire(self, alert):
+        self.__callback(alert)
+
+    def call_later(self, delay, callback):
+        if self.__scheduler is not None:
+            self.__scheduler.call_later(delay, callback)
+
+
+class Scanner:
+    '''
+    Feeds the complete lines of one stream to the matcher, keeping context
+    across chunks. An alert whose following lines are not written yet waits
+    for them at most `CONTEXT_GRACE` seconds.
+    '''
+
+    def __init__(self, matcher, stream):
+        self.__matcher = matcher
+        self.__stream = stream
+        self.__history = deque(maxlen=matcher.context)
+        self.__partial = b''
+        # alerts still collecting lines: [alert, number of lines missing]
+        self.__pending = []
+        self.__lock = threading.Lock()
+
+    def feed(self, chunk):
+        last = chunk.rfind(b'\n')
+        if last < 0:
+            self.__partial = (self.__partial + chunk)[-MAX_PARTIAL:]
+            return
+
+        data = self.__partial + chunk[:last + 1] if self.__partial else chunk[:last + 1]
+        self.__partial = chunk[last + 1:][-MAX_PARTIAL:]
+        self.__scan(data)
+
+    def close(self):
+        if self.__partial:
+            self.__scan(self.__partial + b'\n')
+            self.__partial = b''
+        self.flush()
+
+    def flush(self):
+        '''Fires the pending alerts with the context they collected so far.'''
+        with self.__lock:
+            pending, self.__pending = self.__pending, []
+        for alert, _ in pending:
+            self.__matcher.fire(alert)
+
+    def __complete(self, data):
+        '''Hands the first lines of `data` to the alerts waiting for their context.'''
+        ready = []
+        with self.__lock:
+            for entry in list(self.__pending):
+                alert, missing = entry
+                position = 0
+                while missing and position < len(data):
+                    line_end = data.find(b'\n', position)
+                    alert.context.append(self.__decode(data[position:line_end]))
+                    position = line_end + 1
+                    missing -= 1
+                entry[1] = missing
+                if not missing:
+                    self.__pending.remove(entry)
+                    ready.append(alert)
+        for alert in ready:
+            self.__matcher.fire(alert)
+
+    def __scan(self, data):
+        if self.__pending:
+            self.__complete(data)
+
+        context = self.__matcher.context
+        regex = self.__matcher.regex
+        match = regex.search(data)
+        while match:
+            start = data.rfind(b'\n', 0, match.start()) + 1
+            end = data.find(b'\n', match.start())
+            # continue after the line, every line raises at most one alert per pattern
+            match = regex.search(data, end + 1)
+
+            line = data[start:end]
+            patterns = self.__matcher.accept(line)
+            if not patterns:
+                continue
+
+            before = []
+            position = start
+            while len(before) < context and position > 0:
+                line_start = data.rfind(b'\n', 0, position - 1) + 1
+                before.insert(0, data[line_start:position - 1])
+                position = line_start
+            if len(before) < context and self.__history:
+                before = list(self.__history)[len(before) - context:] + before
+
+            after = []
+            position = end + 1
+            while len(after) < context and position < len(data):
+                line_end = data.find(b'\n', position)
+                after.append(data[position:line_end])
+                position = line_end + 1
+
+            for pattern in patterns:
+                alert = Alert(self.__stream, pattern, self.__decode(line), [self.__decode(entry) for entry in before + [line] + after])
+                if len(after) == context:
+                    self.__matcher.fire(alert)
+                else:
+                    with self.__lock:
+                        self.__pending.append([alert, context - len(after)])
+                    self.__matcher.call_later(CONTEXT_GRACE, self.flush)
+
+        # keep the last lines as context for matches in the next chunk
+        position = len(data) - 1
+        for _ in range(context):
+            position = data.rfind(b'\n', 0, position)
+            if position < 0:
+                break
+        self.__history.extend(data[position + 1:].splitlines())
+
+    @staticmethod
+    def __decode(line):
+        return str(line[:CONTEXT_LINE_LENGTH], 'utf-8', 'replace')
@@ -0,0 +1,70 @@
+import math
+import time
+
+# rates are only recomputed once per window, keeping the hot path cheap
+RATE_WINDOW = 1.0
+# time constant (in seconds) of the exponentially weighted moving average
+EWMA_TAU = 10.0
+
+
+class Meter:
+    '''
+    Measures the byte and line throughput of a stream with an exponentially
+    weighted moving average and the peak rate, both per second.
+    '''
+
+    def __init__(self):
+        self.__bytes = 0
+        self.__lines = 0
+        self.__started = time.monotonic()
+        self.__window = (self.__started, 0, 0)
+        self.__rates = None
+        self.__peaks = (0.0, 0.0)
+        self.__last = None
+
+    def add(self, size, lines):
+        self.__bytes += size
+        self.__lines += lines
+        now = time.monotonic()
+        self.__last = now
+        if now - self.__window[0] >= RATE_WINDOW:
+            self.__rates = self.__fold(now)
+            self.__peaks = tuple(map(max, self.__peaks, self.__window_rates(now)))
+            self.__window = (now, self.__bytes, self.__lines)
+
+    def __window_rates(self, now):
+        start, size, lines = self.__window
+        elapsed = now - start
+        return ((self.__bytes - size) / elapsed, (self.__lines - lines) / elapsed) if elapsed > 0 else (0.0, 0.0)
+
+    def __fold(self, now):
+        '''Folds the rates of the current window into the moving average.'''
+        rates = self.__window_rates(now)
+        if self.__rates is None:
+            return rates
+        alpha = 1 - math.exp(-(now - self.__window[0]) / EWMA_TAU)
+        return tuple(average + alpha * (rate - average) for average, rate in zip(self.__rates, rates))
+
+    @property
+    def idle(self):
+        '''Seconds since anything was added (or since the meter was created).'''
+        return time.monotonic() - (self.__last if self.__last is not None else self.__started)
+
+    def snapshot(self):
+        '''
+        Returns the counters and rates as of now, a stalled stream decays
+        towards zero even though nothing was added in the meantime.
+        '''
+        now = time.monotonic()
+        elapsed = now - self.__started
+        rates = self.__fold(now) if now > self.__window[0] else (self.__rates or (0.0, 0.0))
+        return {
+            'bytes': self.__bytes,
+            'lines': self.__lines,
+            'byte_rate': rates[0],
+            'line_rate': rates[1],
+            'peak_byte_rate': max(self.__peaks[0], rates[0]),
+            'peak_line_rate': max(self.__peaks[1], rates[1]),
+            'avg_byte_rate': self.__bytes / elapsed if elapsed > 0 else 0.0,
+            'idle': now - self.__last if self.__last is not None else elapsed,
+        }
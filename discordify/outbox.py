@@ -0,0 +1,189 @@
+import fcntl
+import glob
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from discordify.serialize import dumps
+
+
+def outbox_path():
+    '''Returns the default outbox of the current user.'''
+    state_dir = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(state_dir, 'discordify', 'outbox.jsonl')
+
+
+class Outbox:
+    '''
+    An append-only journal of the notifications that could not be delivered,
+    one JSON object per line. Updates are only written, terminal reports are
+    also synced to disk. Replaying takes the whole journal over (so several
+    processes never send an entry twice), sends it in order and puts what
+    still fails back in front of entries added in the meantime.
+    '''
+
+    def __init__(self, path):
+        self.__path = path
+
+    @property
+    def path(self):
+        return self.__path
+
+    @contextmanager
+    def __locked(self):
+        os.makedirs(os.path.dirname(self.__path), mode=0o700, exist_ok=True)
+        with open(self.__path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def __write(self, path, entries, durable, mode=os.O_APPEND):
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC | mode, 0o600)
+        try:
+            view = memoryview(b''.join(dumps(entry) + b'\n' for entry in entries))
+            while view:
+                view = view[os.write(descriptor, view):]
+            if durable:
+                os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def append(self, webhook, payload, durable=False):
+        '''Journals a payload for `webhook`, synced to disk if `durable`.'''
+        entry = {'webhook': webhook, 'payload': payload, 'time': time.time()}
+        with self.__locked():
+            self.__write(self.__path, [entry], durable)
+
+    def pending(self):
+        '''Returns whether there are entries to replay, without taking the lock.'''
+        try:
+            return os.stat(self.__path).st_size > 0 or bool(self.__stale())
+        except FileNotFoundError:
+            return bool(self.__stale())
+
+    def __stale(self):
+        '''Journals taken over by replays that did not finish.'''
+        stale = []
+        for path in glob.glob(glob.escape(self.__path) + '.replay-*'):
+            try:
+                os.kill(int(path.rsplit('-', 1)[1]), 0)
+            except ProcessLookupError:
+                stale.append(path)
+            except (ValueError, PermissionError):
+                continue
+        return sorted(stale, key=os.path.getmtime)
+
+    def take(self):
+        '''
+        Takes over all journaled entries, oldest first. Returns them and the file
+        holding them, which is to be passed to `release` after the replay.
+        '''
+        taken = '{}.replay-{}'.format(self.__path, os.getpid())
+        with self.__locked():
+            sources = self.__stale()
+            if os.path.exists(self.__path):
+                os.replace(self.__path, taken)
+                sources.append(taken)
+
+            entries = []
+            for source in sources:
+                with open(source, 'rb') as journal:
+                    for line in journal:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            # an entry cut short by a crash
+                            continue
+            if sources:
+                self.__write(taken, entries, True, os.O_TRUNC)
+                for source in sources:
+                    if source != taken:
+                        os.remove(source)
+        return entries, taken if sources else None
+
+    def release(self, taken, failed):
+        '''Puts the entries that failed again in front of the journal and drops the taken file.'''
+        if not taken:
+            return
+        with self.__locked():
+            if failed:
+                later = b''
+                if os.path.exists(self.__path):
+                    with open(self.__path, 'rb') as journal:
+                        later = journal.read()
+                replacement = self.__path + '.tmp'
+                with open(replacement, 'wb') as journal:
+                    journal.write(b''.join(dumps(entry) + b'\n' for entry in failed) + later)
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                os.replace(replacement, self.__path)
+            os.remove(taken)
+
+    def replay(self, retries=3, rate_limit=30, rate_burst=5, webhooks=None, deadline=None):
+        '''
+        Sends the journaled entries in order, merging consecutive embeds of a
+        webhook into batches and honoring its rate limit. A webhook whose batch
+        fails is not tried further, its remaining entries stay in order. Only
+        the entries of `webhooks` are sent if given, and nothing is sent past
+        the `deadline` (on the monotonic clock). Returns the number of entries
+        sent and kept.
+        '''
+        import discordify.daemon as daemon
+        import discordify.ratelimit as ratelimit
+        import discordify.transport as transport
+
+        entries, taken = self.take()
+        by_webhook = {}
+        for entry in entries:
+            by_webhook.setdefault(entry['webhook'], []).append(entry)
+
+        sent, kept = 0, []
+        headers = {'Content-Type': 'application/json'}
+        for webhook, queued in by_webhook.items():
+            if webhooks is not None and webhook not in webhooks:
+                kept += queued
+                continue
+            limiter = ratelimit.bucket(webhook, rate_limit, rate_burst)
+            position = 0
+            for message in daemon.merge([entry['payload'] for entry in queued]):
+                count = len(message['embeds']) if set(message) == {'embeds'} else 1
+                if deadline is not None and time.monotonic() + (limiter.delay() if limiter else 0) >= deadline:
+                    break
+                try:
+                    result = transport.post(webhook, data=dumps(message), headers=headers, retries=retries, limiter=limiter, deadline=deadline)
+                except Exception as err:
+                    print('Failed to replay notification: {}'.format(err), file=sys.stderr)
+                    break
+                # other errors (e.g. 400) will not go away by replaying
+                if result.status_code in transport.RETRY_STATUS:
+                    break
+                if result.status_code >= 400:
+                    print('Dropped notification rejected with error {}.'.format(result.status_code), file=sys.stderr)
+                else:
+                    sent += count
+                position += count
+            kept += self.__remaining(queued, position)
+
+        self.release(taken, kept)
+        return sent, len(kept)
+
+    @staticmethod
+    def __remaining(queued, embeds):
+        '''The entries after the first `embeds` embeds (or messages) of `queued`.'''
+        remaining = []
+        for entry in queued:
+            payload = entry['payload']
+            count = len(payload['embeds']) if set(payload) == {'embeds'} else 1
+            if embeds >= count:
+                embeds -= count
+                continue
+            if embeds:
+                # part of the embeds were sent with the last batch
+                entry = dict(entry, payload={'embeds': payload['embeds'][embeds:]})
+                embeds = 0
+            remaining.append(entry)
+        return remaining
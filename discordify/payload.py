@@ -1,49 +1,78 @@
-import datetime
 import json
 import os
 import sys
+import threading
 import time
-from abc import ABC, abstractmethod
-from collections import defaultdict
-from discordify.mode import Mode
-import requests
+
+import discordify.stats as stats
+from discordify.event import Event
+from discordify.render import Renderer
+from discordify.serialize import dumps
 
 TEST_MODE = os.environ.get('DISCORDIFY_TESTING')
 
 
-class Payload(ABC):
+class StatusMessage:
+    '''
+    The webhook message of a job that is edited in place by periodic and
+    signal updates, rather than posting a new message for each of them.
+    '''
+
+    def __init__(self):
+        self.id = None
+        self.fingerprint = None
+        self.lock = threading.Lock()
+
+
+class Payload:
 
-    def __init__(self, config, data):
+    def __init__(self, config, data, dispatcher=None, status=None, renderer=None):
         self.__config = config
         self.__data = data
+        self.__dispatcher = dispatcher
+        self.__status = status
+        self.__renderer = renderer or Renderer.create(config)
+        self.__event = None
         self.__payload = {}
 
     @staticmethod
-    def create(config, data):
-        if config.simple:
-            return Message(config, data)
-        else:
-            return Embed(config, data)
+    def create(config, data, dispatcher=None, status=None, renderer=None):
+        return Payload(config, data, dispatcher, status, renderer)
+
+    def emit(self, event, alert=None):
+        """
+        Renders the payload of the event and posts it.
+        """
+        began = time.perf_counter()
+        self.__payload = self.__renderer.render(event, self.__data, alert)
+        if stats.current:
+            stats.current.time('render.' + event.name.lower(), time.perf_counter() - began)
+        self.post(event)
+
+    def emit_summary(self, event):
+        """
+        Renders the summary of a batch (the data of the payload) and posts it.
+        """
+        self.__payload = self.__renderer.render_summary(event, self.__data)
+        self.post(event)
 
-    @abstractmethod
     def emit_final(self):
-        pass
+        self.emit(Event.FINAL)
 
-    @abstractmethod
     def emit_timeout(self):
-        pass
+        self.emit(Event.TIMEOUT)
 
-    @abstractmethod
     def emit_period(self):
-        pass
+        self.emit(Event.PERIOD)
 
-    @abstractmethod
     def emit_signal(self):
-        pass
+        self.emit(Event.SIGNAL)
 
-    @abstractmethod
     def emit_interrupt(self):
-        pass
+        self.emit(Event.INTERRUPT)
+
+    def emit_alert(self, alert):
+        self.emit(Event.ALERT, alert)
 
     @property
     def config(self):
@@ -57,322 +86,175 @@ class Payload(ABC):
     def payload(self):
         return self.__payload
 
+    @property
+    def event(self):
+        return self.__event
+
+    @property
+    def fingerprint(self):
+        '''Identifies the content of the payload, ignoring timestamps and run times.'''
+        return hash((self.__event, self.__data.fingerprint))
+
     @property
     def json(self):
         '''
-        Formats the data into a payload.
+        Formats the data into a payload, as compact UTF-8 encoded JSON.
         '''
-        return json.dumps(self.payload, indent=4)
+        return dumps(self.payload)
 
-    def post(self):
+    def post(self, event):
         """
-        Send the JSON formated object to the specified `self.url`.
+        Hands the payload to the dispatcher, or sends it right away if there is none.
         """
+        self.__event = event
+        if self.__dispatcher:
+            self.__dispatcher.submit(self, event)
+        else:
+            self.send()
 
-        headers = {'Content-Type': 'application/json'}
-
-        if TEST_MODE:
-            print(self.json)
-            return
-
-        result = requests.post(self.__config.webhook, data=self.json, headers=headers)
-
-        if result.status_code >= 400:
-            print(self.json)
-            print("Post Failed, Error {}".format(result.status_code), file=sys.stderr)
-
-
-class Message(Payload):
-
-    def __init__(self, config, data):
-        super().__init__(config, data)
-
-    def emit_timeout(self):
-        self.payload["content"] = '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` just timed out after {runtime}.'.format(
-            emoticon=':clock4:',
-            command=self.data.command,
-            hostname=self.data.hostname,
-            username=self.data.username,
-            runtime=self.data.runtime
-        )
-        self.post()
-
-    def emit_signal(self):
-        self.payload["content"] = '{emoticon} Forced update on your `{command}` command on `{hostname}` started by `{username}` is running for {runtime}.'.format(
-            emoticon=':pushpin:',
-            command=self.data.command,
-            hostname=self.data.hostname,
-            username=self.data.username,
-            runtime=self.data.runtime
-        )
-        self.post()
-
-    def emit_period(self):
-        self.payload["content"] = '{emoticon} Periodic update on your `{command}` command on `{hostname}` started by `{username}` is running for {runtime}.'.format(
-            emoticon=':arrows_counterclockwise:',
-            command=self.data.command,
-            hostname=self.data.hostname,
-            username=self.data.username,
-            runtime=self.data.runtime
-        )
-        self.post()
-
-    def emit_interrupt(self):
-        self.payload["content"] = '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` was just cancelled after {runtime}.'.format(
-            emoticon=':octagonal_sign:',
-            command=self.data.command,
-            hostname=self.data.hostname,
-            username=self.data.username,
-            runtime=self.data.runtime
-        )
-        self.post()
-
-    def emit_final(self):
-        self.payload["content"] = '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` just finished after {runtime}.'.format(
-            emoticon=':white_check_mark:' if self.data.success else ':x:',
-            command=self.data.command,
-            hostname=self.data.hostname,
-            username=self.data.username,
-            runtime=self.data.runtime
-        )
-        self.post()
-
-
-class Embed(Payload):
-
-    def __init__(self, config, data):
-        super().__init__(config, data)
-
-    def __prepare_defaults(self):
-        embed = defaultdict(dict)
-
-        embed["color"] = self.config.color
-
-        embed["author"]["name"] = self.config.user_name
-        embed["author"]["icon_url"] = self.config.user_icon
-        embed["author"]["url"] = self.config.user_url
-
-        if (self.config.title_url):
-            embed["url"] = self.config.title_url
-
-        if self.config.image:
-            embed["image"]['url'] = self.config.image
-
-        if self.config.footer:
-            embed["footer"]['text'] = self.config.footer
-        if self.config.footer_icon:
-            embed['footer']['icon_url'] = self.config.footer_icon
-
-        embed["timestamp"] = self.data.timestamp
-
-        return embed
-
-    def emit_period(self):
-        embed = self.__prepare_defaults()
-
-        # set the icon
-        embed["thumbnail"]['url'] = self.config.icon_period
-
-        embed["title"] = 'Periodic update on `[{pid}] {command}`'.format(pid=self.data.pid, command=self.data.command)
-
-        # >>> description
-        desc = ''
-        if len(self.data.stdin_buffer) > 0:
-            desc += '**STDIN buffer:**\n```\n' + self.data.stdin_buffer + '\n```'
-        if len(self.data.stdout_buffer) > 0:
-            desc += '\n**STDOUT buffer:**\n```\n' + self.data.stdout_buffer + '\n```'
-        if len(self.data.stderr_buffer) > 0:
-            desc += '\n**STDERR buffer:**\n```\n' + self.data.stderr_buffer + '\n```'
-        embed["description"] = desc
-        # <<< description
-
-        embed["fields"] = []
-
-        def append(name, value):
-            embed["fields"].append({"name": name, "value": value, "inline": True})
-
-        append('Run time', self.data.runtime)
-        append('Start time', self.data.start_time)
-
-        append('STDIN',  '{} lines'.format(self.data.stdin_lines))
-        append('STDOUT', '{} lines'.format(self.data.stdout_lines))
-        append('STDERR', '{} lines'.format(self.data.stderr_lines))
-
-        self.payload["embeds"] = []
-        self.payload["embeds"].append(dict(embed))
-
-        self.post()
-
-    def emit_signal(self):
-        embed = self.__prepare_defaults()
-
-        # set the icon
-        embed["thumbnail"]['url'] = self.config.icon_warning
-
-        embed["title"] = 'Forced update on `[' + self.data.pid + '] ' + self.data.command + '`'
-
-        # >>> description
-        desc = ''
-        if len(self.data.stdin_buffer) > 0:
-            desc += '**STDIN buffer:**\n```\n' + self.data.stdin_buffer + '\n```'
-        if len(self.data.stdout_buffer) > 0:
-            desc += '\n**STDOUT buffer:**\n```\n' + self.data.stdout_buffer + '\n```'
-        if len(self.data.stderr_buffer) > 0:
-            desc += '\n**STDERR buffer:**\n```\n' + self.data.stderr_buffer + '\n```'
-        embed["description"] = desc
-        # <<< description
-
-        embed["fields"] = []
-
-        def append(name, value):
-            embed["fields"].append({"name": name, "value": value, "inline": True})
-
-        append('Run time', self.data.runtime)
-        append('Start time', self.data.start_time)
-
-        append('STDIN',  '{} lines'.format(self.data.stdin_lines))
-        append('STDOUT', '{} lines'.format(self.data.stdout_lines))
-        append('STDERR', '{} lines'.format(self.data.stderr_lines))
-
-        self.payload["embeds"] = []
-        self.payload["embeds"].append(dict(embed))
-
-        self.post()
-
-    def emit_final(self):
-        embed = self.__prepare_defaults()
-
-        # set the icon
-        embed["thumbnail"]['url'] = self.config.icon_success if self.data.success else self.config.icon_failure
-
-        embed["title"] = '**CMD:** `' + self.data.command + '`'
-
-        # >>> description
-        desc = ''
-
-        if self.data.mode != Mode.SINK:
-            desc += '**Arguments:**\n```\n'
-            for arg in self.data.arguments:
-                desc += '[' + arg + ']\n'
-            desc += '```\n'
-
-        if len(self.data.stdin_buffer) > 0:
-            desc += '**STDIN buffer:**\n```\n' + self.data.stdin_buffer + '\n```'
-        if len(self.data.stdout_buffer) > 0:
-            desc += '\n**STDOUT buffer:**\n```\n' + self.data.stdout_buffer + '\n```'
-        if len(self.data.stderr_buffer) > 0:
-            desc += '\n**STDERR buffer:**\n```\n' + self.data.stderr_buffer + '\n```'
-        embed["description"] = desc
-        # <<< description
-
-        embed["fields"] = []
-
-        def append(name, value):
-            embed["fields"].append({"name": name, "value": value, "inline": True})
-
-        append('Return Code', self.data.returncode)
-
-        append('Run time', self.data.runtime)
-        append('Start time', self.data.start_time)
-        append('End time', self.data.end_time)
-
-        append('STDIN',  '{} lines'.format(self.data.stdin_lines))
-        append('STDOUT', '{} lines'.format(self.data.stdout_lines))
-        append('STDERR', '{} lines'.format(self.data.stderr_lines))
-
-        self.payload["embeds"] = []
-        self.payload["embeds"].append(dict(embed))
-
-        self.post()
-
-    def emit_interrupt(self):
-        embed = self.__prepare_defaults()
-
-        # set the icon
-        embed["thumbnail"]['url'] = self.config.icon_timeout
-
-        embed["title"] = '**Interrupted CMD:** `' + self.data.command + '`'
-
-        # >>> description
-        desc = ''
-
-        if self.data.mode != Mode.SINK:
-            desc += '**Arguments:**\n```\n'
-            for arg in self.data.arguments:
-                desc += '[' + arg + ']\n'
-            desc += '```\n'
-
-        if len(self.data.stdin_buffer) > 0:
-            desc += '**STDIN buffer:**\n```\n' + self.data.stdin_buffer + '\n```'
-        if len(self.data.stdout_buffer) > 0:
-            desc += '\n**STDOUT buffer:**\n```\n' + self.data.stdout_buffer + '\n```'
-        if len(self.data.stderr_buffer) > 0:
-            desc += '\n**STDERR buffer:**\n```\n' + self.data.stderr_buffer + '\n```'
-        embed["description"] = desc
-        # <<< description
-
-        embed["fields"] = []
-
-        def append(name, value):
-            embed["fields"].append({"name": name, "value": value, "inline": True})
-
-        append('Return Code', self.data.returncode)
-
-        append('Run time', self.data.runtime)
-        append('Start time', self.data.start_time)
-        append('End time', self.data.end_time)
-
-        append('STDIN',  '{} lines'.format(self.data.stdin_lines))
-        append('STDOUT', '{} lines'.format(self.data.stdout_lines))
-        append('STDERR', '{} lines'.format(self.data.stderr_lines))
-
-        self.payload["embeds"] = []
-        self.payload["embeds"].append(dict(embed))
-
-        self.post()
-
-    def emit_timeout(self):
-        embed = self.__prepare_defaults()
-
-        # set the icon
-        embed["thumbnail"]['url'] = self.config.icon_timeout
-
-        embed["title"] = '**Timed out CMD:** `' + self.data.command + '`'
-
-        # >>> description
-        desc = ''
-
-        if self.data.mode != Mode.SINK:
-            desc += '**Arguments:**\n```\n'
-            for arg in self.data.arguments:
-                desc += '[' + arg + ']\n'
-            desc += '```\n'
-
-        if len(self.data.stdin_buffer) > 0:
-            desc += '**STDIN buffer:**\n```\n' + self.data.stdin_buffer + '\n```'
-        if len(self.data.stdout_buffer) > 0:
-            desc += '\n**STDOUT buffer:**\n```\n' + self.data.stdout_buffer + '\n```'
-        if len(self.data.stderr_buffer) > 0:
-            desc += '\n**STDERR buffer:**\n```\n' + self.data.stderr_buffer + '\n```'
-        embed["description"] = desc
-        # <<< description
-
-        embed["fields"] = []
+    def send(self):
+        """
+        Send the JSON formated object to the specified `self.url`. Returns
+        whether it was delivered (or handed to the daemon).
+        """
+        collector = stats.current
+        if not collector:
+            return self.__send()
 
-        def append(name, value):
-            embed["fields"].append({"name": name, "value": value, "inline": True})
+        began = time.perf_counter()
+        delivered = self.__send()
+        collector.observe('post.' + self.__event.name.lower(), time.perf_counter() - began)
+        collector.add('payload.delivered' if delivered else 'payload.failed')
+        return delivered
 
-        append('Return Code', self.data.returncode)
+    def __send(self):
 
-        append('Run time', self.data.runtime)
-        append('Start time', self.data.start_time)
-        append('End time', self.data.end_time)
+        headers = {'Content-Type': 'application/json'}
+        attachments = self.__attachments()
 
-        append('STDIN',  '{} lines'.format(self.data.stdin_lines))
-        append('STDOUT', '{} lines'.format(self.data.stdout_lines))
-        append('STDERR', '{} lines'.format(self.data.stderr_lines))
+        if TEST_MODE:
+            print(json.dumps(self.payload, indent=4))
+            for index, files in enumerate(attachments):
+                for parts in files:
+                    print('Attachment {}: {} ({} bytes)'.format(index + 1, parts[0].filename, sum(part.length for part in parts)))
+            return True
+
+        # imported on first use, so wrapped commands start without loading the HTTP stack
+        import discordify.daemon as daemon
+        import discordify.ratelimit as ratelimit
+        import discordify.transport as transport
+        from discordify.attachment import MultipartBody
+
+        if not attachments and not self.__edits_status() and daemon.submit(self.__config.daemon_socket or daemon.socket_path(), self.__config.webhook, self.payload):
+            if stats.current:
+                stats.current.add('payload.daemon')
+            return True
+
+        limiter = ratelimit.bucket(self.__config.webhook, self.__config.rate_limit, self.__config.rate_burst)
+        bodies = [MultipartBody(self.payload, attachments[0])] if attachments else []
+        # logs that did not fit into the first message follow in messages of their own
+        for index, files in enumerate(attachments[1:], 2):
+            content = 'Logs of `{}` ({}/{})'.format(self.__data.command, index, len(attachments))
+            bodies.append(MultipartBody({'content': content}, files))
+
+        try:
+            data = bodies[0] if bodies else self.json
+            if bodies:
+                headers = {'Content-Type': data.content_type}
+
+            if self.__edits_status():
+                with self.__status.lock:
+                    result = self.__send_status(data, headers, limiter)
+            else:
+                result = transport.post(self.__config.webhook, data=data, headers=headers, retries=self.__config.retries, limiter=limiter)
+
+            for body in bodies[1:]:
+                if result is not None and result.status_code >= 400:
+                    break
+                result = transport.post(self.__config.webhook, data=body, headers={'Content-Type': body.content_type}, retries=self.__config.retries, limiter=limiter)
+        except Exception as err:
+            print('Failed to post notification: {}'.format(err), file=sys.stderr)
+            self.defer()
+            return False
+        finally:
+            for body in bodies:
+                body.close()
+
+        if result is not None and result.status_code >= 400:
+            if result.status_code in transport.RETRY_STATUS:
+                self.defer()
+            print('Post failed with error {}.'.format(result.status_code), file=sys.stderr)
+            return False
+        return True
+
+    def defer(self):
+        """
+        Keeps the payload in the outbox, to be replayed later. Attachments are
+        not kept, terminal reports are synced to disk.
+        """
+        from discordify.outbox import Outbox, outbox_path
 
-        self.payload["embeds"] = []
-        self.payload["embeds"].append(dict(embed))
+        outbox = Outbox(self.__config.outbox or outbox_path())
+        try:
+            outbox.append(self.__config.webhook, self.payload, durable=self.__event.priority == 0)
+        except OSError as err:
+            print('Failed to keep notification in the outbox: {}'.format(err), file=sys.stderr)
+            return
+        if stats.current:
+            stats.current.add('payload.deferred')
+        print('Kept notification in the outbox at {}.'.format(outbox.path), file=sys.stderr)
 
-        self.post()
+    def __attachments(self):
+        """
+        Returns the complete logs to upload with a terminal report, grouped
+        into messages that fit the attachment limit.
+        """
+        if not self.__config.attach_logs or not self.__data.logs or self.__event not in (Event.FINAL, Event.TIMEOUT, Event.INTERRUPT):
+            return []
+        # Slack and plain text webhooks do not accept files
+        if self.__config.format != 'discord':
+            return []
+
+        from discordify.attachment import pack, prepare
+
+        limit = self.__config.attachment_limit
+        parts = []
+        for name, spool in self.__data.logs.items():
+            parts += prepare(name, spool.files, limit, os.path.dirname(spool.path))
+        return pack(parts, limit)
+
+    def __edits_status(self):
+        '''Updates edit the status message, so do terminal reports unless `final_as_new`. Alerts and deadline warnings are new messages.'''
+        if not self.__status:
+            return False
+        if self.__event in (Event.PERIOD, Event.SIGNAL, Event.HEARTBEAT):
+            return True
+        return self.__event in (Event.FINAL, Event.TIMEOUT, Event.INTERRUPT) and not self.__config.final_as_new
+
+    def __send_status(self, data, headers, limiter):
+        """
+        Posts the status message on first use (waiting for its id) and edits it
+        afterwards, unless the content did not change since the last update.
+        """
+        import discordify.transport as transport
+
+        fingerprint = self.fingerprint
+        if self.__status.id:
+            if fingerprint == self.__status.fingerprint:
+                return None
+            url = transport.webhook_url(self.__config.webhook, 'messages/' + self.__status.id)
+            result = transport.request('PATCH', url, retries=self.__config.retries, limiter=limiter, data=data, headers=headers)
+            if result.status_code != 404:
+                self.__status.fingerprint = fingerprint
+                return result
+
+        # the message was never posted or got deleted in the meantime
+        url = transport.webhook_url(self.__config.webhook, wait='true')
+        result = transport.post(url, data=data, headers=headers, retries=self.__config.retries, limiter=limiter)
+        if result.status_code < 400:
+            try:
+                self.__status.id = str(result.json()['id'])
+                self.__status.fingerprint = fingerprint
+            except (ValueError, KeyError):
+                pass
+        return result
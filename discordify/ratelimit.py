@@ -0,0 +1,64 @@
+import threading
+import time
+
+buckets = {}
+buckets_lock = threading.Lock()
+
+
+class TokenBucket:
+    '''
+    Allows bursts of up to `capacity` requests and refills at `rate` requests
+    per second. Blocks the caller until a token is available.
+    '''
+
+    def __init__(self, rate, capacity):
+        self.__rate = rate
+        self.__capacity = capacity
+        self.__tokens = capacity
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+    def delay(self):
+        '''Returns the number of seconds until a token is available.'''
+        with self.__lock:
+            self.__refill()
+            return 0 if self.__tokens >= 1 else (1 - self.__tokens) / self.__rate
+
+    def acquire(self):
+        '''Takes a token, waiting for it if necessary. Returns the time waited.'''
+        waited = 0
+        while True:
+            with self.__lock:
+                self.__refill()
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return waited
+                delay = (1 - self.__tokens) / self.__rate
+            time.sleep(delay)
+            waited += delay
+
+    def update(self, remaining, reset_after):
+        '''Adopts the budget reported by the server (`X-RateLimit-*` headers).'''
+        with self.__lock:
+            self.__refill()
+            if remaining == 0:
+                # no tokens left until the server's window resets
+                self.__tokens = min(self.__tokens, 1 - reset_after * self.__rate)
+            else:
+                self.__tokens = min(self.__tokens, remaining)
+
+
+def bucket(url, per_minute, burst):
+    '''Returns the bucket shared by every notification to `url`, None if `per_minute` does not limit the rate.'''
+    if per_minute <= 0:
+        return None
+    with buckets_lock:
+        if url not in buckets:
+            # a bucket holding less than one token never lets a request through
+            buckets[url] = TokenBucket(per_minute / 60, max(1, burst))
+        return buckets[url]
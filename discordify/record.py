@@ -0,0 +1,150 @@
+import datetime
+import math
+import shlex
+import time
+
+# lines of output kept per record
+TAIL_LINES = 3
+# characters per line of output kept per record
+TAIL_LENGTH = 120
+
+
+def tail(buffer, lines=TAIL_LINES):
+    '''The last lines of a rendered buffer, shortened for a record.'''
+    return '\n'.join(line[:TAIL_LENGTH] for line in buffer.splitlines()[-lines:])
+
+
+def command_line(args):
+    '''The full command line of a record, quoted like a shell would need it.'''
+    return ' '.join(shlex.quote(arg) for arg in args)
+
+
+def duration(seconds):
+    '''Formats seconds like the run times of the reports, without the microseconds.'''
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def percentile(ordered, share):
+    '''Nearest-rank percentile of an ordered list.'''
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+class Record:
+    '''
+    The outcome of one command in a compact form: enough to be listed in a
+    summary, small enough to keep thousands of them.
+    '''
+
+    __slots__ = ('id', 'command', 'returncode', 'runtime', 'started', 'host', 'tail')
+
+    def __init__(self, id, command, returncode, runtime, started=0.0, host='', tail=''):
+        self.id = str(id)
+        self.command = command
+        self.returncode = returncode
+        self.runtime = runtime
+        self.started = started
+        self.host = host
+        self.tail = tail
+
+    @staticmethod
+    def from_data(id, data):
+        '''Condenses the data of a finished command, the tail is taken from stderr if it failed and wrote any.'''
+        returncode = data.returncode if isinstance(data.returncode, int) else None
+        buffer = data.stderr_buffer if returncode != 0 and data.stderr_buffer else data.stdout_buffer
+        return Record(id, data.command_line, returncode, data.duration, data.started, data.hostname, tail(buffer))
+
+    @property
+    def success(self):
+        return self.returncode == 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @staticmethod
+    def from_dict(values):
+        return Record(**{name: values[name] for name in Record.__slots__ if name in values})
+
+
+class Summary:
+    '''
+    Aggregates records into counts and a run time distribution. Failures are
+    listed first, in the order they were added.
+    '''
+
+    def __init__(self, records, total=None, title=None, started=None, ended=None):
+        self.__records = list(records)
+        self.__total = total if total is not None else len(self.__records)
+        self.__title = title
+        self.__started = started
+        self.__ended = ended
+        self.__runtimes = sorted(record.runtime for record in self.__records)
+
+    @property
+    def title(self):
+        return self.__title
+
+    @property
+    def total(self):
+        return self.__total
+
+    @property
+    def done(self):
+        return len(self.__records)
+
+    @property
+    def failures(self):
+        return [record for record in self.__records if not record.success]
+
+    @property
+    def failed(self):
+        return len(self.failures)
+
+    @property
+    def success(self):
+        return self.done == self.total and not self.failed
+
+    @property
+    def records(self):
+        '''Failures first, then the successful records.'''
+        return self.failures + [record for record in self.__records if record.success]
+
+    @property
+    def p50(self):
+        return percentile(self.__runtimes, 0.5)
+
+    @property
+    def p95(self):
+        return percentile(self.__runtimes, 0.95)
+
+    @property
+    def max(self):
+        return self.__runtimes[-1] if self.__runtimes else 0.0
+
+    @property
+    def wall_time(self):
+        '''Time from the first start to the last end, None if unknown.'''
+        if self.__started is not None and self.__ended is not None:
+            return self.__ended - self.__started
+        if not self.__records:
+            return None
+        return max(record.started + record.runtime for record in self.__records) - min(record.started for record in self.__records)
+
+    @property
+    def hosts(self):
+        return sorted({record.host for record in self.__records if record.host})
+
+    @property
+    def timestamp(self):
+        return str(datetime.datetime.utcfromtimestamp(time.time()))
+
+    @property
+    def fingerprint(self):
+        '''Identifies the progress, see Data.fingerprint.'''
+        return hash((self.total, self.done, self.failed))
+
+    @property
+    def logs(self):
+        '''Summaries never carry logs, see Data.logs.'''
+        return {}
@@ -0,0 +1,521 @@
+from abc import ABC, abstractmethod
+from string import Formatter
+
+from discordify.event import Event
+from discordify.mode import Mode
+from discordify.utils import bytes_conversion
+
+TERMINAL = (Event.FINAL, Event.TIMEOUT, Event.INTERRUPT)
+
+# Discord's limits (in characters), larger payloads are rejected
+MAX_CONTENT = 2000
+MAX_TITLE = 256
+MAX_DESCRIPTION = 4096
+MAX_FIELD_NAME = 256
+MAX_FIELD_VALUE = 1024
+MAX_FIELDS = 25
+MAX_EMBED = 6000
+# Slack's limits of Block Kit messages
+MAX_SLACK_HEADER = 150
+MAX_SLACK_TEXT = 3000
+MAX_SLACK_FIELD = 2000
+MAX_SLACK_FIELDS = 10
+# a conservative limit for plain text webhooks
+MAX_TEXT = 4000
+# characters of a command line listed in a summary
+MAX_SUMMARY_COMMAND = 80
+# marks the start of a buffer whose oldest lines were cut
+CUT_MARKER = '[{} characters cut]\n'
+
+# values available to templates, looked up only when a template uses them
+FIELDS = {
+    'command': lambda data, alert: data.command,
+    'pid': lambda data, alert: data.pid,
+    'hostname': lambda data, alert: data.hostname,
+    'username': lambda data, alert: data.username,
+    'runtime': lambda data, alert: data.runtime,
+    'start_time': lambda data, alert: data.start_time,
+    'end_time': lambda data, alert: data.end_time,
+    'returncode': lambda data, alert: data.returncode,
+    'stdin_lines': lambda data, alert: data.stdin_lines,
+    'stdout_lines': lambda data, alert: data.stdout_lines,
+    'stderr_lines': lambda data, alert: data.stderr_lines,
+    'pattern': lambda data, alert: alert.pattern if alert else '',
+    'stream': lambda data, alert: alert.stream if alert else '',
+    'line': lambda data, alert: alert.line if alert else '',
+}
+
+EMOTICONS = {
+    Event.TIMEOUT: ':clock4:',
+    Event.INTERRUPT: ':octagonal_sign:',
+    Event.SIGNAL: ':pushpin:',
+    Event.PERIOD: ':arrows_counterclockwise:',
+    Event.ALERT: ':rotating_light:',
+    Event.DEADLINE: ':hourglass_flowing_sand:',
+    Event.HEARTBEAT: ':zzz:',
+}
+
+MESSAGE_TEMPLATES = {
+    Event.FINAL: {'content': '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` just finished after {runtime}.'},
+    Event.TIMEOUT: {'content': '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` just timed out after {runtime}.'},
+    Event.INTERRUPT: {'content': '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` was just cancelled after {runtime}.'},
+    Event.SIGNAL: {'content': '{emoticon} Forced update on your `{command}` command on `{hostname}` started by `{username}` is running for {runtime}.'},
+    Event.PERIOD: {'content': '{emoticon} Periodic update on your `{command}` command on `{hostname}` started by `{username}` is running for {runtime}.'},
+    Event.ALERT: {'content': '{emoticon} `{pattern}` matched the {stream} of your `{command}` command on `{hostname}` started by `{username}`:\n```\n{line}\n```'},
+    Event.DEADLINE: {'content': '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` is running for {runtime} and about to time out.'},
+    Event.HEARTBEAT: {'content': '{emoticon} Your `{command}` command on `{hostname}` started by `{username}` is running for {runtime} without writing any output lately.'},
+}
+
+SLACK_TEMPLATES = {
+    Event.FINAL: {'title': '{emoticon} {command} finished after {runtime}'},
+    Event.TIMEOUT: {'title': '{emoticon} {command} timed out after {runtime}'},
+    Event.INTERRUPT: {'title': '{emoticon} {command} was cancelled after {runtime}'},
+    Event.SIGNAL: {'title': '{emoticon} Forced update on [{pid}] {command}'},
+    Event.PERIOD: {'title': '{emoticon} Periodic update on [{pid}] {command}'},
+    Event.ALERT: {'title': '{emoticon} Alert on [{pid}] {command}'},
+    Event.DEADLINE: {'title': '{emoticon} [{pid}] {command} is about to time out'},
+    Event.HEARTBEAT: {'title': '{emoticon} No output from [{pid}] {command}'},
+}
+
+EMBED_TEMPLATES = {
+    Event.FINAL: {'title': '**CMD:** `{command}`'},
+    Event.TIMEOUT: {'title': '**Timed out CMD:** `{command}`'},
+    Event.INTERRUPT: {'title': '**Interrupted CMD:** `{command}`'},
+    Event.SIGNAL: {'title': 'Forced update on `[{pid}] {command}`'},
+    Event.PERIOD: {'title': 'Periodic update on `[{pid}] {command}`'},
+    Event.ALERT: {'title': 'Alert on `[{pid}] {command}`'},
+    Event.DEADLINE: {'title': 'About to time out: `[{pid}] {command}`'},
+    Event.HEARTBEAT: {'title': 'No output from `[{pid}] {command}`'},
+}
+
+
+def clip(text, limit):
+    '''Cuts `text` to `limit` characters, marking the cut with an ellipsis.'''
+    if len(text) <= limit:
+        return text
+    return text[:max(0, limit - 1)] + '…'
+
+
+def trim(text, limit):
+    '''
+    Cuts the oldest part of `text` to fit `limit` characters, at a line
+    boundary if possible, and marks the cut.
+    '''
+    if len(text) <= limit:
+        return text
+    marker = CUT_MARKER.format(len(text))
+    if limit < len(marker):
+        return text[len(text) - limit:] if limit > 0 else ''
+    keep = limit - len(marker)
+    start = len(text) - keep
+    newline = text.find('\n', start, len(text) - 1)
+    if newline >= 0:
+        start = newline + 1
+    return CUT_MARKER.format(start) + text[start:]
+
+
+def fit(head, sections, limit):
+    '''
+    Joins `head` and the (prefix, text, suffix) sections into at most `limit`
+    characters. If they do not fit, the space left is shared equally among
+    the texts, unused shares go to the longer ones, and every text is
+    trimmed from its oldest side.
+    '''
+    head = clip(head, limit)
+    overhead = len(head) + sum(len(prefix) + len(suffix) for prefix, _, suffix in sections)
+    available = limit - overhead
+    if sum(len(text) for _, text, _ in sections) <= available:
+        return head + ''.join(prefix + text + suffix for prefix, text, suffix in sections)
+    if available <= 0:
+        return clip(head, limit)
+
+    shares = {}
+    remaining = available
+    order = sorted(range(len(sections)), key=lambda index: len(sections[index][1]))
+    for position, index in enumerate(order):
+        share = remaining // (len(order) - position)
+        shares[index] = min(len(sections[index][1]), share)
+        remaining -= shares[index]
+    return head + ''.join(prefix + trim(text, shares[index]) + suffix for index, (prefix, text, suffix) in enumerate(sections))
+
+
+class Template:
+    '''
+    A format string, checked against the known fields when it is compiled.
+    Strings without fields are returned as they are.
+    '''
+
+    def __init__(self, text):
+        fields = set()
+        for _, field, _, _ in Formatter().parse(text):
+            if field is None:
+                continue
+            name = field.split('.')[0].split('[')[0]
+            if name != 'emoticon' and name not in FIELDS:
+                raise ValueError('Unknown field "{}" in template "{}".'.format(field, text))
+            fields.add(name)
+        self.__text = text
+        self.__render = text.format_map if fields else None
+
+    @property
+    def text(self):
+        return self.__text
+
+    def render(self, context):
+        return self.__render(context) if self.__render else self.__text
+
+
+def compile_templates(templates):
+    '''
+    Compiles user templates, given as {"final": {"title": "..."}, ...}, into
+    {Event.FINAL: {"title": Template}, ...}. Raises ValueError for unknown
+    events or fields.
+    '''
+    compiled = {}
+    for name, keys in (templates or {}).items():
+        try:
+            event = Event[name.upper()]
+        except KeyError:
+            raise ValueError('Unknown event "{}" in templates, expected one of {}.'.format(
+                name, ', '.join(event.name.lower() for event in Event)))
+        compiled[event] = {key: text if isinstance(text, Template) else Template(text) for key, text in keys.items()}
+    return compiled
+
+
+class Context(dict):
+    '''The values of one rendering, computed on first use.'''
+
+    def __init__(self, data, alert, **values):
+        super().__init__(values)
+        self.__data = data
+        self.__alert = alert
+
+    def __missing__(self, key):
+        value = self[key] = FIELDS[key](self.__data, self.__alert)
+        return value
+
+
+def stream_summary(data, name, lines):
+    throughput = data.throughput.get(name)
+    if not throughput or not throughput['bytes']:
+        return '{} lines'.format(lines)
+
+    return '{} lines, {}\n{}/s ({:.0f} lines/s), peak {}/s'.format(
+        lines,
+        bytes_conversion(throughput['bytes']),
+        bytes_conversion(int(throughput['byte_rate'])),
+        throughput['line_rate'],
+        bytes_conversion(int(throughput['peak_byte_rate'])))
+
+
+def resource_fields(data):
+    resources = data.resources
+    if not resources:
+        return []
+
+    return [
+        ('CPU', '{:.1f}% avg / {:.1f}% max'.format(resources['cpu_avg'], resources['cpu_max'])),
+        ('Memory', '{} avg / {} peak'.format(bytes_conversion(resources['rss_avg']), bytes_conversion(resources['rss_peak']))),
+        ('I/O', '{} read / {} written'.format(bytes_conversion(resources['read_bytes']), bytes_conversion(resources['write_bytes']))),
+        ('Threads', '{} max'.format(resources['threads_max'])),
+        # the CPU share discordify spends on sampling
+        ('Sampling overhead', '{:.2f}% CPU'.format(resources['overhead'] * 100)),
+    ]
+
+
+def report_fields(event, data):
+    '''The (name, value) fields of the report of an event.'''
+    if event == Event.ALERT:
+        return [
+            ('Run time', data.runtime),
+            ('Start time', data.start_time),
+            ('STDOUT', stream_summary(data, 'stdout', data.stdout_lines)),
+            ('STDERR', stream_summary(data, 'stderr', data.stderr_lines)),
+        ]
+
+    fields = []
+    if event in TERMINAL:
+        fields.append(('Return Code', data.returncode))
+    fields.append(('Run time', data.runtime))
+    fields.append(('Start time', data.start_time))
+    if event in TERMINAL:
+        fields.append(('End time', data.end_time))
+
+    fields.append(('STDIN', stream_summary(data, 'stdin', data.stdin_lines)))
+    fields.append(('STDOUT', stream_summary(data, 'stdout', data.stdout_lines)))
+    fields.append(('STDERR', stream_summary(data, 'stderr', data.stderr_lines)))
+    fields.extend(resource_fields(data))
+
+    if event in TERMINAL:
+        if data.coalesced:
+            fields.append(('Coalesced updates', data.coalesced))
+        if data.suppressed:
+            fields.append(('Suppressed alerts', data.suppressed))
+        if data.spool_dir:
+            fields.append(('Logs', '`{}:{}`'.format(data.hostname, data.spool_dir)))
+    return fields
+
+
+def description(event, data, alert, limit, strong='**'):
+    '''
+    The description of the report of an event in at most `limit` characters,
+    `strong` is the markup for bold text.
+    '''
+    if event == Event.ALERT:
+        head = '{0}Pattern:{0} `{1}`\n'.format(strong, alert.pattern)
+        return fit(head, [('{0}{1}:{0}\n```\n'.format(strong, alert.stream.upper()), '\n'.join(alert.context), '\n```')], limit)
+
+    head = ''
+    if event in TERMINAL and data.mode != Mode.SINK:
+        head = '{0}Arguments:{0}\n```\n'.format(strong) + ''.join('[' + arg + ']\n' for arg in data.argument or []) + '```\n'
+
+    sections = []
+    for name, buffer in (('STDIN', data.stdin_buffer), ('STDOUT', data.stdout_buffer), ('STDERR', data.stderr_buffer)):
+        if buffer:
+            # sections are separated by a newline
+            prefix = '\n' if name != 'STDIN' else ''
+            sections.append(('{0}{1}{2} buffer:{1}\n```\n'.format(prefix, strong, name), buffer, '\n```'))
+    return fit(head, sections, limit)
+
+
+SUMMARY_TITLES = {
+    Event.FINAL: '{emoticon} Batch {title}finished: {done}/{total} done, {failed} failed',
+    Event.INTERRUPT: '{emoticon} Batch {title}was cancelled: {done}/{total} done, {failed} failed',
+    Event.PERIOD: '{emoticon} Batch {title}running: {done}/{total} done, {failed} failed',
+}
+
+
+def summary_title(event, summary):
+    emoticon = (':white_check_mark:' if summary.success else ':x:') if event == Event.FINAL else EMOTICONS[event]
+    title = '`{}` '.format(summary.title) if summary.title else ''
+    return SUMMARY_TITLES[event].format(emoticon=emoticon, title=title, done=summary.done, total=summary.total, failed=summary.failed)
+
+
+def summary_fields(summary):
+    '''The (name, value) fields of a batch summary.'''
+    from discordify.record import duration
+
+    fields = [
+        ('Done', '{}/{}'.format(summary.done, summary.total)),
+        ('Failed', summary.failed),
+        ('Run time', 'p50 {} / p95 {} / max {}'.format(duration(summary.p50), duration(summary.p95), duration(summary.max))),
+    ]
+    if summary.failed:
+        fields.append(('Failed tasks', clip(', '.join(record.id for record in summary.failures), MAX_FIELD_VALUE)))
+    if summary.wall_time is not None:
+        fields.append(('Wall time', duration(summary.wall_time)))
+    if len(summary.hosts) > 1:
+        fields.append(('Hosts', clip(', '.join(summary.hosts), MAX_FIELD_VALUE)))
+    return fields
+
+
+def summary_description(summary, limit, strong='**'):
+    '''
+    Lists the records of a summary in at most `limit` characters, failures
+    first with the tail of their output, then the successful ones.
+    '''
+    from discordify.record import duration
+
+    records = summary.records
+    text = ''
+    for position, record in enumerate(records):
+        command = clip(record.command, MAX_SUMMARY_COMMAND)
+        if record.success:
+            line = '{0}#{1}{0} `{2}` after {3}\n'.format(strong, record.id, command, duration(record.runtime))
+        else:
+            line = '{0}#{1}{0} `{2}` returned {3} after {4}\n'.format(
+                strong, record.id, command, record.returncode if record.returncode is not None else '<unavailable>', duration(record.runtime))
+            if record.tail:
+                line += '```\n{}\n```\n'.format(record.tail)
+        rest = '… and {} more'.format(len(records) - position)
+        if len(text) + len(line) + (len(rest) if position + 1 < len(records) else 0) > limit:
+            return text + rest if len(text) + len(rest) <= limit else text
+        text += line
+    return text
+
+
+class Renderer(ABC):
+    '''
+    Turns the data of an event into a webhook payload. Everything that does
+    not depend on the data (templates, skeleton, icons) is prepared once, a
+    renderer is meant to be shared by all payloads of a command.
+    '''
+
+    def __init__(self, config, defaults):
+        self.__config = config
+        self.__templates = compile_templates({event.name: keys for event, keys in defaults.items()})
+        for event, keys in compile_templates(config.templates).items():
+            self.__templates[event].update(keys)
+
+    @staticmethod
+    def create(config):
+        if config.format == 'slack':
+            return SlackRenderer(config)
+        if config.format == 'text':
+            return TextRenderer(config)
+        if config.simple:
+            return MessageRenderer(config)
+        return EmbedRenderer(config)
+
+    @property
+    def config(self):
+        return self.__config
+
+    def templates(self, event):
+        return self.__templates[event]
+
+    def context(self, event, data, alert=None):
+        if event == Event.FINAL:
+            emoticon = ':white_check_mark:' if data.success else ':x:'
+        else:
+            emoticon = EMOTICONS[event]
+        return Context(data, alert, emoticon=emoticon)
+
+    @abstractmethod
+    def render(self, event, data, alert=None):
+        pass
+
+    @abstractmethod
+    def render_summary(self, event, summary):
+        '''Renders the summary of a batch, summaries are not templated.'''
+        pass
+
+
+class MessageRenderer(Renderer):
+
+    def __init__(self, config):
+        super().__init__(config, MESSAGE_TEMPLATES)
+
+    def render(self, event, data, alert=None):
+        return {'content': clip(self.templates(event)['content'].render(self.context(event, data, alert)), MAX_CONTENT)}
+
+    def render_summary(self, event, summary):
+        return {'content': clip(summary_title(event, summary), MAX_CONTENT)}
+
+
+class TextRenderer(Renderer):
+    '''Plain text for generic webhooks (Slack, Mattermost and the like), with the messages of Discord.'''
+
+    def __init__(self, config):
+        super().__init__(config, MESSAGE_TEMPLATES)
+
+    def render(self, event, data, alert=None):
+        return {'text': clip(self.templates(event)['content'].render(self.context(event, data, alert)), MAX_TEXT)}
+
+    def render_summary(self, event, summary):
+        return {'text': clip(summary_title(event, summary), MAX_TEXT)}
+
+
+class SlackRenderer(Renderer):
+    '''Slack Block Kit messages, with the message of Discord as notification text.'''
+
+    def __init__(self, config):
+        super().__init__(config, {event: dict(MESSAGE_TEMPLATES[event], **SLACK_TEMPLATES[event]) for event in Event})
+        footer = config.footer
+        self.__footer = {'type': 'context', 'elements': [{'type': 'mrkdwn', 'text': clip(footer, MAX_SLACK_TEXT)}]} if footer else None
+
+    def render(self, event, data, alert=None):
+        templates = self.templates(event)
+        context = self.context(event, data, alert)
+
+        if 'description' in templates:
+            text = clip(templates['description'].render(context), MAX_SLACK_TEXT)
+        else:
+            text = description(event, data, alert, MAX_SLACK_TEXT, strong='*')
+        blocks = self.__blocks(templates['title'].render(context), text, report_fields(event, data))
+        return {'text': clip(templates['content'].render(context), MAX_TEXT), 'blocks': blocks}
+
+    def render_summary(self, event, summary):
+        title = summary_title(event, summary)
+        blocks = self.__blocks(title, summary_description(summary, MAX_SLACK_TEXT, strong='*'), summary_fields(summary))
+        return {'text': clip(title, MAX_TEXT), 'blocks': blocks}
+
+    def __blocks(self, title, text, fields):
+        blocks = [{'type': 'header', 'text': {'type': 'plain_text', 'text': clip(title, MAX_SLACK_HEADER), 'emoji': True}}]
+        if text:
+            blocks.append({'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}})
+
+        fields = [{'type': 'mrkdwn', 'text': clip('*{}*\n{}'.format(name, value), MAX_SLACK_FIELD)} for name, value in fields]
+        for start in range(0, len(fields), MAX_SLACK_FIELDS):
+            blocks.append({'type': 'section', 'fields': fields[start:start + MAX_SLACK_FIELDS]})
+        if self.__footer:
+            blocks.append(self.__footer)
+        return blocks
+
+
+class EmbedRenderer(Renderer):
+
+    def __init__(self, config):
+        super().__init__(config, EMBED_TEMPLATES)
+        self.__skeleton = self.__prepare_skeleton()
+        # author and footer count towards the size of every embed
+        self.__static_size = len(self.__skeleton['author']['name'] or '') + len(self.__skeleton.get('footer', {}).get('text', ''))
+        self.__icons = {
+            Event.TIMEOUT: config.icon_timeout,
+            Event.INTERRUPT: config.icon_timeout,
+            Event.SIGNAL: config.icon_warning,
+            Event.PERIOD: config.icon_period,
+            Event.ALERT: config.icon_warning,
+            Event.DEADLINE: config.icon_warning,
+            Event.HEARTBEAT: config.icon_period,
+        }
+
+    def __prepare_skeleton(self):
+        '''The parts of the embed that are the same for every event, shared and never modified.'''
+        config = self.config
+        skeleton = {
+            'color': config.color,
+            'author': {'name': config.user_name, 'icon_url': config.user_icon, 'url': config.user_url},
+        }
+        if config.title_url:
+            skeleton['url'] = config.title_url
+        if config.image:
+            skeleton['image'] = {'url': config.image}
+        footer = {}
+        if config.footer:
+            footer['text'] = config.footer
+        if config.footer_icon:
+            footer['icon_url'] = config.footer_icon
+        if footer:
+            skeleton['footer'] = footer
+        return skeleton
+
+    def __icon(self, event, success):
+        if event == Event.FINAL:
+            return self.config.icon_success if success else self.config.icon_failure
+        return self.__icons[event]
+
+    def __embed(self, event, success, timestamp, title, fields):
+        embed = dict(self.__skeleton)
+        embed['timestamp'] = timestamp
+        embed['thumbnail'] = {'url': self.__icon(event, success)}
+        embed['title'] = clip(title, MAX_TITLE)
+        embed['fields'] = [{'name': clip(name, MAX_FIELD_NAME), 'value': value if len(str(value)) <= MAX_FIELD_VALUE else clip(str(value), MAX_FIELD_VALUE), 'inline': True}
+                           for name, value in fields[:MAX_FIELDS]]
+        return embed
+
+    def __description_limit(self, embed):
+        '''The description gets what is left of the size of the embed.'''
+        used = self.__static_size + len(embed['title']) + sum(len(field['name']) + len(str(field['value'])) for field in embed['fields'])
+        return max(0, min(MAX_DESCRIPTION, MAX_EMBED - used))
+
+    def render(self, event, data, alert=None):
+        templates = self.templates(event)
+        context = self.context(event, data, alert)
+
+        embed = self.__embed(event, data.success, data.timestamp, templates['title'].render(context), report_fields(event, data))
+        limit = self.__description_limit(embed)
+        if 'description' in templates:
+            embed['description'] = clip(templates['description'].render(context), limit)
+        else:
+            embed['description'] = description(event, data, alert, limit)
+
+        payload = {'embeds': [embed]}
+        if 'content' in templates:
+            payload['content'] = clip(templates['content'].render(context), MAX_CONTENT)
+        return payload
+
+    def render_summary(self, event, summary):
+        embed = self.__embed(event, summary.success, summary.timestamp, summary_title(event, summary), summary_fields(summary))
+        embed['description'] = summary_description(summary, self.__description_limit(embed))
+        return {'embeds': [embed]}
@@ -0,0 +1,91 @@
+import time
+from array import array
+
+
+class Sampler:
+    '''
+    Samples CPU, memory, I/O and thread usage of a process and all of its
+    descendants. Samples are kept in compact `array` series, the time spent
+    sampling is tracked to keep the overhead measurable.
+    '''
+
+    def __init__(self, pid):
+        self.__pid = pid
+        self.__cpu = array('d')
+        self.__rss = array('Q')
+        self.__threads = array('L')
+        # last I/O counters of every process seen, exited ones keep contributing
+        self.__io = {}
+        # psutil computes the CPU usage between two calls on the same object
+        self.__processes = {}
+        self.__root = None
+        self.__started = None
+        self.__spent = 0.0
+
+    def sample(self):
+        import psutil
+
+        began = time.thread_time()
+        if self.__started is None:
+            self.__started = time.monotonic()
+
+        try:
+            if self.__root is None:
+                self.__root = psutil.Process(self.__pid)
+            processes = [self.__root] + self.__root.children(recursive=True)
+        except psutil.Error:
+            return
+
+        cpu, rss, threads = 0.0, 0, 0
+        alive = {}
+        for process in processes:
+            process = self.__processes.get(process.pid, process)
+            try:
+                with process.oneshot():
+                    cpu += process.cpu_percent(None)
+                    rss += process.memory_info().rss
+                    threads += process.num_threads()
+                    if hasattr(process, 'io_counters'):
+                        counters = process.io_counters()
+                        # Linux also counts I/O served from the page cache and pipes
+                        self.__io[process.pid] = (getattr(counters, 'read_chars', counters.read_bytes),
+                                                  getattr(counters, 'write_chars', counters.write_bytes))
+            except psutil.Error:
+                continue
+            alive[process.pid] = process
+        self.__processes = alive
+
+        self.__cpu.append(cpu)
+        self.__rss.append(rss)
+        self.__threads.append(threads)
+        self.__spent += time.thread_time() - began
+
+    @property
+    def overhead(self):
+        '''Share of a CPU spent on sampling since the first sample.'''
+        if self.__started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.__started
+        return self.__spent / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def summary(self):
+        '''Returns min/avg/max of the samples, or None if nothing was sampled yet.'''
+        if not self.__cpu:
+            return None
+
+        # the first CPU sample of a process is always 0
+        cpu = self.__cpu[1:] or self.__cpu
+        return {
+            'samples': len(self.__cpu),
+            'cpu_min': min(cpu),
+            'cpu_avg': sum(cpu) / len(cpu),
+            'cpu_max': max(cpu),
+            'rss_min': min(self.__rss),
+            'rss_avg': sum(self.__rss) // len(self.__rss),
+            'rss_peak': max(self.__rss),
+            'read_bytes': sum(read for read, _ in self.__io.values()),
+            'write_bytes': sum(write for _, write in self.__io.values()),
+            'threads_max': max(self.__threads),
+            'overhead': self.overhead,
+        }
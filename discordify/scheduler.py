@@ -0,0 +1,96 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Scheduler:
+    '''
+    Runs callbacks at deadlines on the monotonic clock, kept in a min-heap.
+    Repeating callbacks are due at fixed multiples of their interval from the
+    first deadline, so they do not drift by the time the callbacks take;
+    deadlines missed in the meantime are skipped rather than run in a burst.
+    The scheduler is either driven by an event loop (`timeout` and `fire`)
+    or runs on a thread of its own (`start`).
+    '''
+
+    def __init__(self):
+        self.__heap = []
+        self.__sequence = itertools.count()
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__stopped = False
+
+    def __len__(self):
+        return sum(1 for entry in self.__heap if entry[2])
+
+    def call_later(self, delay, callback, interval=None):
+        '''Runs `callback` in `delay` seconds and then every `interval` seconds, returns a handle to cancel it.'''
+        return self.call_at(time.monotonic() + delay, callback, interval)
+
+    def call_at(self, deadline, callback, interval=None):
+        entry = [deadline, next(self.__sequence), callback, interval]
+        with self.__condition:
+            heapq.heappush(self.__heap, entry)
+            self.__condition.notify()
+        return entry
+
+    @staticmethod
+    def cancel(entry):
+        '''Cancels a callback, it is dropped from the heap once it is due.'''
+        entry[2] = None
+
+    def timeout(self):
+        '''Seconds until the next deadline, None if nothing is scheduled.'''
+        with self.__condition:
+            while self.__heap and not self.__heap[0][2]:
+                heapq.heappop(self.__heap)
+            return max(0, self.__heap[0][0] - time.monotonic()) if self.__heap else None
+
+    def fire(self):
+        '''Runs the callbacks that are due.'''
+        now = time.monotonic()
+        due = []
+        with self.__condition:
+            while self.__heap and self.__heap[0][0] <= now:
+                entry = heapq.heappop(self.__heap)
+                if not entry[2]:
+                    continue
+                due.append(entry)
+                interval = entry[3]
+                if interval:
+                    entry[0] += interval
+                    if entry[0] <= now:
+                        entry[0] += ((now - entry[0]) // interval + 1) * interval
+                    entry[1] = next(self.__sequence)
+                    heapq.heappush(self.__heap, entry)
+
+        for entry in due:
+            callback = entry[2]
+            if callback:
+                callback()
+
+    def start(self):
+        '''Runs the callbacks from a background thread.'''
+        self.__thread = threading.Thread(target=self.__run, name='SCHEDULER', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify()
+        # a callback may stop the scheduler it runs on
+        if self.__thread and self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__stopped:
+                    timeout = self.timeout()
+                    if timeout == 0:
+                        break
+                    self.__condition.wait(timeout)
+                if self.__stopped:
+                    return
+            self.fire()
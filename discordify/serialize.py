@@ -0,0 +1,32 @@
+import json
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def backend():
+    '''Returns the function serializing to JSON bytes, orjson if it is installed.'''
+    try:
+        import orjson
+    except ImportError:
+        return lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return orjson.dumps
+
+
+def dumps(obj):
+    '''Serializes `obj` to compact, UTF-8 encoded JSON.'''
+    return backend()(obj)
+
+
+@lru_cache(maxsize=None)
+def parser():
+    '''Returns the function parsing JSON (str or bytes), orjson if it is installed.'''
+    try:
+        import orjson
+    except ImportError:
+        return json.loads
+    return orjson.loads
+
+
+def loads(data):
+    '''Parses JSON from `data`.'''
+    return parser()(data)
@@ -0,0 +1,151 @@
+import gzip
+import mmap
+import os
+import shutil
+import threading
+
+from discordify.ansi import Sanitizer
+
+# the tail is searched for in the last bytes of a segment only
+SCAN_LIMIT = 1 << 20
+
+
+def tail(path, lines, size=None):
+    '''
+    Returns the last `lines` lines of the file at `path` (and whether the file
+    had fewer lines), scanning for newlines backwards in a memory map.
+    '''
+    with open(path, 'rb') as segment:
+        size = os.fstat(segment.fileno()).st_size if size is None else size
+        if not size or not lines:
+            return [], True
+        with mmap.mmap(segment.fileno(), size, access=mmap.ACCESS_READ) as view:
+            floor = max(0, size - SCAN_LIMIT)
+            end = size - 1 if view[size - 1:size] == b'\n' else size
+            position = end
+            for _ in range(lines):
+                position = view.rfind(b'\n', floor, position)
+                if position < 0:
+                    break
+            complete = position < 0 and floor == 0
+            return view[max(position + 1, floor):end].split(b'\n'), complete
+
+
+class Spool:
+    '''
+    Writes the complete output of a stream to a file in the run directory.
+    Once a segment reaches `max_bytes` it is rotated (and optionally gzipped),
+    at most `segments` of them are kept. Only the sizes are kept in memory,
+    the tail for the reports is read back from the files. Implements the
+    interface of RingBuffer, so it can take its place in a Stream.
+    '''
+
+    # takes the output as it is, only the tail is sanitized when it is decoded
+    raw = True
+
+    def __init__(self, directory, name, max_lines, line_length, max_bytes, segments=4, compress=False):
+        self.__path = os.path.join(directory, name + '.log')
+        self.__max_lines = max_lines
+        self.__line_length = line_length
+        self.__max_bytes = max_bytes
+        self.__segments = max(1, segments)
+        self.__compress = compress
+        self.__fd = os.open(self.__path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+        self.__size = 0
+        self.__total = 0
+        self.__lock = threading.Lock()
+        self.__compressor = None
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def files(self):
+        '''The segments on disk, oldest first.'''
+        if self.__compressor:
+            self.__compressor.join()
+        rotated = []
+        for index in range(self.__segments - 1, 0, -1):
+            for path in (self.__segment(index), self.__segment(index) + '.gz'):
+                if os.path.exists(path):
+                    rotated.append(path)
+        return rotated + [self.__path]
+
+    def __segment(self, index):
+        return '{}.{}'.format(self.__path, index)
+
+    def append(self, chunk):
+        with self.__lock:
+            if self.__size and self.__size + len(chunk) > self.__max_bytes:
+                self.__rotate()
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(self.__fd, view):]
+            self.__size += len(chunk)
+            self.__total += len(chunk)
+
+    def __rotate(self):
+        if self.__compressor:
+            self.__compressor.join()
+
+        os.close(self.__fd)
+        for index in range(self.__segments - 1, 0, -1):
+            for suffix in ('', '.gz'):
+                source = self.__segment(index) + suffix
+                if not os.path.exists(source):
+                    continue
+                if index + 1 < self.__segments:
+                    os.replace(source, self.__segment(index + 1) + suffix)
+                else:
+                    os.remove(source)
+
+        if self.__segments > 1:
+            os.replace(self.__path, self.__segment(1))
+            if self.__compress:
+                self.__compressor = threading.Thread(target=self.__gzip, args=(self.__segment(1),), name='SPOOL', daemon=True)
+                self.__compressor.start()
+        self.__fd = os.open(self.__path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+        self.__size = 0
+
+    @staticmethod
+    def __gzip(path):
+        descriptor = os.open(path + '.gz', os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+        with open(path, 'rb') as source, open(descriptor, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        os.remove(path)
+
+    def decode(self):
+        '''Returns the last lines as strings, truncated like the ones of a RingBuffer.'''
+        with self.__lock:
+            lines, complete = tail(self.__path, self.__max_lines, self.__size)
+            if complete and len(lines) < self.__max_lines:
+                try:
+                    lines = tail(self.__segment(1), self.__max_lines - len(lines))[0] + lines
+                except FileNotFoundError:
+                    # not rotated yet, or removed once it was compressed
+                    pass
+        if not lines:
+            return []
+        text = Sanitizer().feed(b'\n'.join(lines) + b'\n')
+        return [self.__truncate(line) for line in text.split(b'\n')[:-1]]
+
+    def __truncate(self, line):
+        cut = self.__line_length
+        if cut < len(line):
+            # do not split a multi-byte UTF-8 sequence
+            while cut > 0 and line[cut] & 0xC0 == 0x80:
+                cut -= 1
+        return str(line[:cut], 'utf-8', 'replace')
+
+    def close(self):
+        '''Closes the current segment and waits for a rotated one to be compressed.'''
+        with self.__lock:
+            if self.__compressor:
+                self.__compressor.join()
+            if self.__fd is not None:
+                os.close(self.__fd)
+                self.__fd = None
+
+    def __bool__(self):
+        return bool(self.__total and self.__max_lines)
@@ -0,0 +1,94 @@
+import bisect
+import os
+import sys
+import threading
+import time
+
+from discordify.serialize import dumps
+
+# upper bounds (in milliseconds) of the latency histogram buckets, the last one is open
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# the collector of this process, None unless enabled: instrumented code checks it
+# once, so counting costs nothing while it is off
+current = None
+
+
+def enable():
+    '''Starts collecting, returns the collector.'''
+    global current
+    if current is None:
+        current = Stats()
+    return current
+
+
+class Stats:
+    '''
+    Counters, accumulated timings, high-water marks and latency histograms
+    of discordify itself, keyed by dotted names like `stream.stdout.tap`.
+    '''
+
+    def __init__(self):
+        # reentrant, a snapshot may be taken by a signal handler interrupting an update
+        self.__lock = threading.RLock()
+        self.__started = time.monotonic()
+        self.__counters = {}
+        self.__timers = {}
+        self.__peaks = {}
+        self.__histograms = {}
+
+    def add(self, name, value=1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def time(self, name, seconds):
+        '''Accumulates the time spent in `name`: count, total and max.'''
+        with self.__lock:
+            timer = self.__timers.get(name)
+            if timer is None:
+                timer = self.__timers[name] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+    def peak(self, name, value):
+        '''Keeps the highest value seen, e.g. of a queue depth.'''
+        with self.__lock:
+            if name not in self.__peaks or value > self.__peaks[name]:
+                self.__peaks[name] = value
+
+    def observe(self, name, seconds):
+        '''Counts a latency into its histogram bucket.'''
+        index = bisect.bisect_left(BUCKETS, seconds * 1000)
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = [0] * (len(BUCKETS) + 1)
+            histogram[index] += 1
+
+    def snapshot(self, **extra):
+        '''Returns all values as of now, along with the `extra` sections.'''
+        with self.__lock:
+            snapshot = {
+                'pid': os.getpid(),
+                'time': time.time(),
+                'uptime': time.monotonic() - self.__started,
+                'counters': dict(self.__counters),
+                'timers': {name: {'count': count, 'total_s': total, 'max_s': peak} for name, (count, total, peak) in self.__timers.items()},
+                'peaks': dict(self.__peaks),
+                'histograms': {name: {'le_ms': list(BUCKETS) + [None], 'counts': list(counts)} for name, counts in self.__histograms.items()},
+            }
+        snapshot.update(extra)
+        return snapshot
+
+    def dump(self, path, **extra):
+        '''Writes a snapshot as JSON to `path` (replacing it at once) or, for "-", to stderr.'''
+        data = dumps(self.snapshot(**extra)) + b'\n'
+        if path == '-':
+            os.write(sys.stderr.fileno(), data)
+            return
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
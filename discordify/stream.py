@@ -0,0 +1,155 @@
+import errno
+import os
+import time
+
+import discordify.stats as stats
+from discordify.meter import Meter
+
+CHUNK_SIZE = 1 << 16
+
+
+def write_all(fd, data):
+    '''Writes all of `data` to the file descriptor, retrying on partial writes.'''
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class Stream:
+    '''
+    Forwards the raw bytes of a pipe to a sink file descriptor in large chunks
+    while keeping a tail of the output for the reports. With a `sanitizer`,
+    only the plain text reaches the buffer and the scanner, the sink and a
+    `raw` buffer (the complete log) still get the raw bytes. The `name` keys
+    the statistics of the stream.
+    '''
+
+    def __init__(self, source, sink, buffer, scanner=None, sanitizer=None, name='stream'):
+        self.__source = source
+        self.__sink = sink
+        self.__buffer = buffer
+        self.__scanner = scanner
+        self.__sanitizer = sanitizer
+        self.__name = name
+        self.__lines = 0
+        self.__bytes = 0
+        self.__partial = False
+        self.__meter = Meter()
+
+    @property
+    def source(self):
+        return self.__source
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def buffer(self):
+        return self.__buffer
+
+    @property
+    def lines(self):
+        return self.__lines + (1 if self.__partial else 0)
+
+    @property
+    def bytes(self):
+        return self.__bytes
+
+    @property
+    def sink(self):
+        return self.__sink
+
+    @property
+    def idle(self):
+        '''Seconds since the source was last read from.'''
+        return self.__meter.idle
+
+    @property
+    def throughput(self):
+        return self.__meter.snapshot()
+
+    def tap(self, chunk):
+        '''Accounts a chunk read from the source without forwarding it.'''
+        collector = stats.current
+        if collector:
+            began = time.perf_counter()
+        lines = chunk.count(b'\n')
+        self.__lines += lines
+        self.__bytes += len(chunk)
+        self.__meter.add(len(chunk), lines)
+        self.__partial = not chunk.endswith(b'\n')
+        if self.__buffer.raw:
+            self.__buffer.append(chunk)
+        self.__capture(self.__sanitizer.feed(chunk) if self.__sanitizer else chunk)
+        if collector:
+            collector.time('stream.{}.tap'.format(self.__name), time.perf_counter() - began)
+
+    def __capture(self, text):
+        if text:
+            if not self.__buffer.raw:
+                self.__buffer.append(text)
+            if self.__scanner:
+                self.__scanner.feed(text)
+
+    def feed(self, chunk):
+        '''
+        Accounts a chunk read from the source and forwards it to the sink. A
+        memoryview is written to the sink as it is, the reports get the bytes
+        it covers (its whole buffer if it covers all of it).
+        '''
+        if isinstance(chunk, memoryview):
+            self.tap(chunk.obj if len(chunk) == len(chunk.obj) else chunk.tobytes())
+        else:
+            self.tap(chunk)
+
+        if self.__sink is not None:
+            collector = stats.current
+            if collector:
+                began = time.perf_counter()
+            try:
+                write_all(self.__sink, chunk)
+            except BrokenPipeError:
+                # keep draining the source so the child does not block on a full pipe
+                self.__sink = None
+            if collector:
+                # includes the time blocked by a sink that does not keep up
+                collector.time('stream.{}.write'.format(self.__name), time.perf_counter() - began)
+
+    def pump(self, drain=True):
+        '''
+        Forwards the source until EOF. Reads go into one buffer that is reused
+        for every chunk, writes block while the sink does not keep up and so
+        hold back the reads. Once the sink is closed, the source is drained if
+        `drain`, otherwise forwarding stops.
+        '''
+        fd = self.__source.fileno()
+        chunk = bytearray(CHUNK_SIZE)
+        # one view of the buffer, slicing it does not copy the chunk
+        view = memoryview(chunk)
+        try:
+            while True:
+                try:
+                    size = os.readv(fd, (chunk,))
+                except OSError as err:
+                    # the terminal side of a pseudo-terminal or our stdin was closed
+                    if err.errno not in (errno.EIO, errno.EBADF):
+                        raise
+                    size = 0
+                if not size:
+                    break
+                self.feed(view[:size])
+                if self.__sink is None and not drain:
+                    break
+        finally:
+            self.close()
+
+    def close(self):
+        '''Closes the source once it reached EOF.'''
+        self.__source.close()
+        if self.__sanitizer:
+            self.__capture(self.__sanitizer.close())
+        self.__buffer.close()
+        if self.__scanner:
+            self.__scanner.close()
@@ -0,0 +1,135 @@
+import getopt
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+
+import discordify.exit_codes as codes
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    '''
+    A local webhook for tests and benchmarks. Answers every request after
+    `latency` seconds, rate limits a share of them (429 with Retry-After) and
+    fails another share (5xx). Messages are answered with an id like Discord
+    does for `?wait=true`, every request is recorded.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, rate_limited=0.0, failing=0.0, retry_after=0.1, seed=None):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.failing = failing
+        self.retry_after = retry_after
+        self.requests = []
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/api/webhooks/stub/token'.format(self.server_address[1])
+
+    def start(self):
+        '''Serves from a background thread.'''
+        threading.Thread(target=self.serve_forever, name='STUB', daemon=True).start()
+        return self
+
+    def record(self, method, path, headers, body, status):
+        with self.lock:
+            self.requests.append({'time': time.time(), 'method': method, 'path': path,
+                                  'content_type': headers.get('Content-Type'), 'size': len(body), 'status': status, 'body': body})
+
+    def outcome(self):
+        '''Returns the status of the next answer.'''
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.rate_limited:
+            return 429
+        if draw < self.rate_limited + self.failing:
+            return 503
+        return 200
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.__answer()
+
+    def do_PATCH(self):
+        self.__answer()
+
+    def __answer(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        status = self.server.outcome()
+        self.server.record(self.command, self.path, self.headers, body, status)
+
+        if status == 429:
+            content = json.dumps({'message': 'You are being rate limited.', 'retry_after': self.server.retry_after}).encode('utf-8')
+        elif status >= 500:
+            content = b'{"message": "Service unavailable"}'
+        else:
+            content = json.dumps({'id': str(len(self.server.requests))}).encode('utf-8')
+
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', str(self.server.retry_after))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def usage():
+    print('USAGE: python -m discordify.stub [--port PORT] [--latency SECONDS] [--rate_limited SHARE] [--failing SHARE] [--retry_after SECONDS]')
+
+
+def main():
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'h', ['help', 'port=', 'latency=', 'rate_limited=', 'failing=', 'retry_after='])
+    except getopt.GetoptError as err:
+        print(err, file=sys.stderr)
+        usage()
+        sys.exit(codes.EXIT_INVALID_ARGS)
+
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts:
+        usage()
+        sys.exit(codes.EXIT_OK)
+
+    server = StubServer(port=int(opts.get('--port', 8080)),
+                        latency=float(opts.get('--latency', 0)),
+                        rate_limited=float(opts.get('--rate_limited', 0)),
+                        failing=float(opts.get('--failing', 0)),
+                        retry_after=float(opts.get('--retry_after', 0.1)))
+    print('Listening at {}'.format(server.url), flush=True)
+    # every request as one JSON line
+    seen = 0
+    server.start()
+    try:
+        while True:
+            time.sleep(0.1)
+            with server.lock:
+                fresh = server.requests[seen:]
+                seen = len(server.requests)
+            for request in fresh:
+                print(json.dumps(dict(request, body=str(request['body'][:200], 'utf-8', 'replace'))), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+from discordify.payload import StatusMessage
+from discordify.render import Renderer
+
+
+class Target:
+    '''
+    A webhook to notify with its own configuration. The renderer and the
+    edited status message of a target are shared by all of its payloads.
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self.renderer = Renderer.create(config)
+        # only Discord webhooks can edit their messages
+        self.status = StatusMessage() if config.edit_in_place and config.format == 'discord' else None
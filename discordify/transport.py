@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+import discordify.stats as stats
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+REQUEST_TIMEOUT = 30
+POOL_SIZE = 4
+
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def session(url):
+    '''Returns the keep-alive session shared by all requests to the host of `url`.'''
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    with sessions_lock:
+        if key not in sessions:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            sessions[key] = requests.Session()
+            sessions[key].mount('{}://{}'.format(*key), adapter)
+        return sessions[key]
+
+
+def webhook_url(url, path=None, **query):
+    '''Appends a sub path and query parameters to the webhook url, keeping its own query.'''
+    parts = urlsplit(url)
+    if path:
+        parts = parts._replace(path=parts.path.rstrip('/') + '/' + path)
+    if query:
+        parts = parts._replace(query=urlencode(parse_qsl(parts.query) + list(query.items())))
+    return urlunsplit(parts)
+
+
+def retry_after(response):
+    '''
+    Extracts the delay (in seconds) requested by the server, Discord sends it
+    in `Retry-After` or `X-RateLimit-Reset-After`.
+    '''
+    for header in ('Retry-After', 'X-RateLimit-Reset-After'):
+        try:
+            return max(0, float(response.headers[header]))
+        except (KeyError, ValueError):
+            pass
+    return None
+
+
+def backoff(attempt):
+    '''Exponential backoff with full jitter.'''
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (1 << attempt)))
+
+
+def update_limiter(limiter, response):
+    try:
+        remaining = int(response.headers['X-RateLimit-Remaining'])
+        reset_after = float(response.headers['X-RateLimit-Reset-After'])
+    except (KeyError, ValueError):
+        return
+    limiter.update(remaining, reset_after)
+
+
+def request(method, url, retries=3, limiter=None, deadline=None, **kwargs):
+    '''
+    Sends a request over the pooled session of the host. Rate limited (429)
+    and failed (5xx, connection errors) requests are retried up to `retries`
+    times, honoring the delay the server asks for. Every attempt takes a token
+    from the `limiter`, if given. With a `deadline` (on the monotonic clock)
+    no attempt runs past it. Returns the last response, or raises the last
+    connection error. Streamed bodies are rewound before every attempt.
+    '''
+    timeout = kwargs.pop('timeout', REQUEST_TIMEOUT)
+    body = kwargs.get('data')
+    collector = stats.current
+    for attempt in range(retries + 1):
+        error = None
+        if limiter:
+            limiter.acquire()
+        if deadline is not None:
+            kwargs['timeout'] = max(0.001, min(timeout, deadline - time.monotonic()))
+        else:
+            kwargs['timeout'] = timeout
+        if hasattr(body, 'seek'):
+            body.seek(0)
+        if collector:
+            collector.add('http.attempts')
+            if attempt:
+                collector.add('http.retries')
+            began = time.perf_counter()
+        try:
+            response = session(url).request(method, url, **kwargs)
+        except requests.RequestException as err:
+            response, error = None, err
+            if collector:
+                collector.add('http.errors')
+        else:
+            if collector:
+                collector.observe('http.latency', time.perf_counter() - began)
+                collector.add('http.status.{}'.format(response.status_code))
+            if limiter:
+                update_limiter(limiter, response)
+            if response.status_code not in RETRY_STATUS:
+                return response
+
+        if attempt == retries:
+            break
+
+        delay = retry_after(response) if response is not None else None
+        delay = delay if delay is not None else backoff(attempt)
+        if deadline is not None and time.monotonic() + max(delay, limiter.delay() if limiter else 0) >= deadline:
+            break
+        time.sleep(delay)
+
+    if error:
+        raise error
+    return response
+
+
+def post(url, data, headers, retries=3, limiter=None, deadline=None):
+    return request('POST', url, retries=retries, limiter=limiter, deadline=deadline, data=data, headers=headers)
@@ -1,6 +1,8 @@
-import psutil
 import math
+from functools import lru_cache
+from getpass import getuser
 from hashlib import md5
+from socket import gethostname
 
 
 def bytes_conversion(number):
@@ -21,15 +23,22 @@ def bytes_conversion(number):
     return "%s %s" % (number, unit_dict[num_length])
 
 
-def cpu_percent():
-    return psutil.cpu_percent(interval=1)
-
-
 def total_memory():
+    import psutil
     mem = psutil.virtual_memory()
     return mem.total
 
 
+@lru_cache(maxsize=None)
+def username():
+    return getuser()
+
+
+@lru_cache(maxsize=None)
+def hostname():
+    return gethostname()
+
+
 def compute_gravatar_url(email):
     email = email.strip().lower()
     hash = md5(email.encode("utf8")).hexdigest()
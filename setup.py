@@ -8,6 +8,7 @@ setup(name='discordify',
       author_email='sascha.just@own-hero.net',
       license='MIT',
       packages=['discordify'],
+      python_requires='>=3.7',
       install_requires=[
           'requests',
           'psutil'
@@ -1,2 +1,2 @@
 #!/bin/sh
-exit 0
\ No newline at end of file
+cd "$(dirname "$0")/.." && exec python -m unittest discover -s test
@@ -0,0 +1,52 @@
+import unittest
+
+from discordify.ansi import MAX_CARRY, Sanitizer
+
+
+def sanitize(*chunks):
+    sanitizer = Sanitizer()
+    return b''.join(sanitizer.feed(chunk) for chunk in chunks) + sanitizer.close()
+
+
+class SanitizerTest(unittest.TestCase):
+
+    def test_strips_colors(self):
+        self.assertEqual(sanitize(b'\x1b[1;31mred\x1b[0m and plain\n'), b'red and plain\n')
+
+    def test_strips_control_characters(self):
+        self.assertEqual(sanitize(b'bell\x07 and\x08 tab\tkept\n'), b'bell and tab\tkept\n')
+
+    def test_carries_sequences_cut_between_chunks(self):
+        sanitizer = Sanitizer()
+        self.assertEqual(sanitizer.feed(b'red \x1b['), b'')
+        self.assertEqual(sanitizer.feed(b'3'), b'')
+        self.assertEqual(sanitizer.feed(b'1mtext\x1b[0m\n'), b'red text\n')
+
+    def test_carries_titles_cut_between_chunks(self):
+        self.assertEqual(sanitize(b'\x1b]0;a ti', b'tle\x07shown\n'), b'shown\n')
+        self.assertEqual(sanitize(b'\x1b]0;title\x1b', b'\\shown\n'), b'shown\n')
+
+    def test_escape_at_the_end_of_a_chunk(self):
+        self.assertEqual(sanitize(b'line\n\x1b', b'[2Knext\n'), b'line\nnext\n')
+
+    def test_drops_overlong_sequences(self):
+        sanitizer = Sanitizer()
+        sanitizer.feed(b'\x1b]0;' + b'x' * MAX_CARRY)
+        self.assertEqual(sanitizer.feed(b'after\n'), b'after\n')
+
+    def test_collapses_carriage_returns(self):
+        self.assertEqual(sanitize(b' 10%\r 50%\r100%\ndone\n'), b'100%\ndone\n')
+        self.assertEqual(sanitize(b' 10%\r', b' 50%\r', b'100%\n'), b'100%\n')
+
+    def test_holds_back_the_current_line(self):
+        sanitizer = Sanitizer()
+        self.assertEqual(sanitizer.feed(b'complete\nparti'), b'complete\n')
+        self.assertEqual(sanitizer.close(), b'parti')
+
+    def test_binary_data_only_loses_control_characters(self):
+        # NUL bytes never occur in text, escape sequences are not looked for
+        self.assertEqual(sanitize(b'\x00\x1b[31mdata\xff\n'), b'[31mdata\xff\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
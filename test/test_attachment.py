@@ -0,0 +1,36 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from discordify.attachment import MultipartBody, prepare
+
+
+class PrepareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='discordify-test-')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'stdout.0')
+        with open(self.path, 'wb') as log:
+            log.write(b'line of output\n' * 1000)
+
+    def test_uploads_a_small_log_as_it_is(self):
+        parts = prepare('stdout', [self.path], 1 << 20, self.directory)
+        self.assertEqual([part.filename for part in parts], ['stdout.log'])
+        MultipartBody({}, [parts]).close()
+
+    def test_compressed_log_leaves_no_file_behind(self):
+        parts = prepare('stdout', [self.path], 1000, self.directory)
+        self.assertEqual([part.filename for part in parts], ['stdout.log.gz'])
+        self.assertEqual(os.listdir(self.directory), ['stdout.0'])
+
+        part = parts[0]
+        self.assertEqual(gzip.decompress(os.pread(part.source.fileno(), part.length, part.offset)), b'line of output\n' * 1000)
+        MultipartBody({}, [parts]).close()
+        self.assertEqual(os.listdir(self.directory), ['stdout.0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from discordify.buffer import RingBuffer
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def test_keeps_the_last_lines(self):
+        buffer = RingBuffer(2, 4096, 50)
+        buffer.append(b'one\ntwo\nthree\n')
+        self.assertEqual(buffer.decode(), ['two', 'three'])
+        buffer.append(b'four\nfi')
+        buffer.append(b've')
+        self.assertEqual(buffer.decode(), ['four', 'five'])
+
+    def test_truncates_long_lines(self):
+        buffer = RingBuffer(5, 4096, 4)
+        buffer.append(b'abcdefgh\nxy')
+        buffer.append(b'zzzzz\n')
+        self.assertEqual(buffer.decode(), ['abcd', 'xyzz'])
+
+    def test_does_not_split_utf8_sequences(self):
+        buffer = RingBuffer(5, 4096, 5)
+        # the euro sign takes bytes 5 to 7, the line is cut before it
+        buffer.append('aaaa€b\n'.encode('utf-8'))
+        # a two byte sequence fits exactly
+        buffer.append('aaaé€\n'.encode('utf-8'))
+        self.assertEqual(buffer.decode(), ['aaaa', 'aaaé'])
+
+    def test_does_not_split_utf8_sequences_across_chunks(self):
+        buffer = RingBuffer(5, 4096, 5)
+        buffer.append(b'aaaa')
+        buffer.append('€b\n'.encode('utf-8'))
+        buffer.append('ä'.encode('utf-8')[:1])
+        buffer.append('ä'.encode('utf-8')[1:] + b'\n')
+        self.assertEqual(buffer.decode(), ['aaaa', 'ä'])
+
+    def test_drops_lines_that_no_longer_fit(self):
+        buffer = RingBuffer(10, 12, 50)
+        buffer.append(b'first\nsecond\nthird\n')
+        # the oldest lines were overwritten in the ring
+        self.assertEqual(buffer.decode(), ['second', 'third'])
+        self.assertEqual(len(buffer), 2)
+
+    def test_disabled(self):
+        buffer = RingBuffer(0)
+        buffer.append(b'ignored\n')
+        self.assertEqual(buffer.decode(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from discordify.dispatch import Dispatcher
+from discordify.event import Event
+
+
+class FakePayload:
+    '''Records when it is sent or deferred, a `gate` holds the sending thread.'''
+
+    def __init__(self, name, log, webhook='webhook', gate=None):
+        self.name = name
+        self.config = SimpleNamespace(webhook=webhook)
+        self.__log = log
+        self.__gate = gate
+
+    def send(self):
+        if self.__gate:
+            self.__gate.wait()
+        self.__log.sent.append(self.name)
+        return True
+
+    def defer(self):
+        self.__log.deferred.append(self.name)
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log = SimpleNamespace(sent=[], deferred=[])
+        self.dispatcher = Dispatcher()
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+
+    def payload(self, name, **kwargs):
+        return FakePayload(name, self.log, **kwargs)
+
+    def block(self):
+        '''Keeps the sending thread busy, so the following payloads are queued.'''
+        started = threading.Event()
+        gate = self.gate
+
+        class Blocking(FakePayload):
+            def send(payload):
+                started.set()
+                return FakePayload.send(payload)
+        self.dispatcher.submit(Blocking('blocking', self.log, gate=gate), Event.SIGNAL)
+        self.assertTrue(started.wait(5))
+
+    def test_newer_periodic_update_replaces_a_queued_one(self):
+        self.block()
+        for name in ('period 1', 'period 2', 'period 3'):
+            self.dispatcher.submit(self.payload(name), Event.PERIOD)
+        self.gate.set()
+
+        self.assertEqual(self.dispatcher.close(5), 0)
+        self.assertEqual(self.log.sent, ['blocking', 'period 3'])
+        self.assertEqual(self.dispatcher.coalesced, 2)
+
+    def test_terminal_report_drops_queued_updates_only(self):
+        self.block()
+        self.dispatcher.submit(self.payload('period'), Event.PERIOD)
+        self.dispatcher.submit(self.payload('heartbeat'), Event.HEARTBEAT)
+        self.dispatcher.submit(self.payload('alert'), Event.ALERT)
+        self.dispatcher.submit(self.payload('final'), Event.FINAL)
+        self.gate.set()
+
+        self.assertEqual(self.dispatcher.close(5), 0)
+        # terminal reports first, then by priority
+        self.assertEqual(self.log.sent, ['blocking', 'final', 'alert', 'heartbeat'])
+        self.assertEqual(self.dispatcher.coalesced, 1)
+
+    def test_webhooks_are_notified_concurrently(self):
+        self.block()
+        self.dispatcher.submit(self.payload('other', webhook='other'), Event.FINAL)
+        self.dispatcher.close(0.5)
+        self.assertIn('other', self.log.sent)
+
+    def test_undelivered_payloads_are_deferred(self):
+        self.block()
+        self.dispatcher.submit(self.payload('final'), Event.FINAL)
+
+        self.assertEqual(self.dispatcher.close(0.1), 2)
+        # the payload being sent may be lost with the process, it is kept as well
+        self.assertEqual(self.log.deferred, ['blocking', 'final'])
+
+    def test_late_terminal_reports_are_deferred(self):
+        self.dispatcher.close(1)
+        self.dispatcher.submit(self.payload('late final'), Event.FINAL)
+        self.dispatcher.submit(self.payload('late period'), Event.PERIOD)
+        self.assertEqual(self.log.sent, [])
+        self.assertEqual(self.log.deferred, ['late final'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from discordify.outbox import Outbox
+from discordify.stub import StubServer
+
+# high enough that the rate limiter never waits in a test
+RATE_LIMIT = 60000
+
+
+def embed(title):
+    return {'embeds': [{'title': title}]}
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='discordify-test-')
+        self.outbox = Outbox(os.path.join(self.directory, 'outbox.jsonl'))
+        self.stub = StubServer().start()
+        self.statuses = []
+        outcome = self.stub.outcome
+        # answers with the queued statuses first
+        self.stub.outcome = lambda: self.statuses.pop(0) if self.statuses else outcome()
+
+    def tearDown(self):
+        self.stub.shutdown()
+        self.stub.server_close()
+        shutil.rmtree(self.directory)
+
+    def journal(self):
+        if not os.path.exists(self.outbox.path):
+            return []
+        with open(self.outbox.path, 'rb') as journal:
+            return [json.loads(line) for line in journal]
+
+    def bodies(self):
+        return [json.loads(request['body']) for request in self.stub.requests]
+
+    def test_replay_merges_embeds_into_batches(self):
+        for title in ('a', 'b', 'c'):
+            self.outbox.append(self.stub.url, embed(title))
+
+        self.assertEqual(self.outbox.replay(0, RATE_LIMIT, 5), (3, 0))
+        self.assertEqual(self.bodies(), [{'embeds': [{'title': 'a'}, {'title': 'b'}, {'title': 'c'}]}])
+        self.assertFalse(self.outbox.pending())
+
+    def test_replay_keeps_order_after_partial_failure(self):
+        for content in ('one', 'two', 'three'):
+            self.outbox.append(self.stub.url, {'content': content})
+        # the second message fails, an entry is added while the replay runs
+        self.statuses = [200, 503]
+        outcome = self.stub.outcome
+
+        def add_entry():
+            status = outcome()
+            if status == 503:
+                self.outbox.append(self.stub.url, {'content': 'four'})
+            return status
+        self.stub.outcome = add_entry
+
+        self.assertEqual(self.outbox.replay(0, RATE_LIMIT, 5), (1, 2))
+        self.assertEqual([entry['payload']['content'] for entry in self.journal()], ['two', 'three', 'four'])
+
+    def test_replay_keeps_the_embeds_of_a_failed_batch(self):
+        for title in ('a', 'b'):
+            self.outbox.append(self.stub.url, embed(title))
+        self.statuses = [429]
+
+        self.assertEqual(self.outbox.replay(0, RATE_LIMIT, 5), (0, 2))
+        self.assertEqual([entry['payload'] for entry in self.journal()], [embed('a'), embed('b')])
+
+    def test_replay_drops_rejected_entries(self):
+        self.outbox.append(self.stub.url, {'content': 'invalid'})
+        self.outbox.append(self.stub.url, {'content': 'valid'})
+        self.statuses = [400]
+
+        self.assertEqual(self.outbox.replay(0, RATE_LIMIT, 5), (1, 0))
+        self.assertEqual(self.journal(), [])
+
+    def test_replay_only_sends_the_given_webhooks(self):
+        other = 'http://127.0.0.1:9/api/webhooks/other/token'
+        self.outbox.append(other, {'content': 'elsewhere'})
+        self.outbox.append(self.stub.url, {'content': 'here'})
+
+        self.assertEqual(self.outbox.replay(0, RATE_LIMIT, 5, webhooks={self.stub.url}), (1, 1))
+        self.assertEqual(self.bodies(), [{'content': 'here'}])
+        self.assertEqual([entry['webhook'] for entry in self.journal()], [other])
+
+    def test_replay_stops_at_the_deadline(self):
+        self.stub.latency = 5
+        self.outbox.append(self.stub.url, {'content': 'slow'})
+        self.outbox.append(self.stub.url, {'content': 'slower'})
+
+        began = time.monotonic()
+        self.assertEqual(self.outbox.replay(3, RATE_LIMIT, 5, deadline=began + 0.5), (0, 2))
+        self.assertLess(time.monotonic() - began, 2)
+        self.assertEqual(len(self.journal()), 2)
+
+    def test_take_and_release(self):
+        self.outbox.append(self.stub.url, {'content': 'one'})
+        self.outbox.append(self.stub.url, {'content': 'two'})
+
+        entries, taken = self.outbox.take()
+        self.assertEqual([entry['payload']['content'] for entry in entries], ['one', 'two'])
+        self.assertTrue(os.path.exists(taken))
+        self.assertFalse(os.path.exists(self.outbox.path))
+        # added while the taken entries are replayed
+        self.outbox.append(self.stub.url, {'content': 'three'})
+
+        self.outbox.release(taken, entries[1:])
+        self.assertFalse(os.path.exists(taken))
+        self.assertEqual([entry['payload']['content'] for entry in self.journal()], ['two', 'three'])
+
+    def test_take_recovers_stale_replays(self):
+        # the journal taken over by a replay that died
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        stale = '{}.replay-{}'.format(self.outbox.path, process.pid)
+        with open(stale, 'w') as journal:
+            journal.write(json.dumps({'webhook': self.stub.url, 'payload': {'content': 'stale'}}) + '\n{"cut short')
+        self.outbox.append(self.stub.url, {'content': 'new'})
+
+        self.assertTrue(self.outbox.pending())
+        entries, taken = self.outbox.take()
+        self.assertEqual([entry['payload']['content'] for entry in entries], ['stale', 'new'])
+        self.assertFalse(os.path.exists(stale))
+        self.outbox.release(taken, [])
+        self.assertFalse(self.outbox.pending())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from discordify.config import Arguments
+from discordify.data import Data
+from discordify.event import Event
+from discordify.matcher import Alert
+from discordify.mode import Mode
+from discordify.payload import TEST_MODE, Payload
+from discordify.stub import StubServer
+from discordify.target import Target
+
+
+def data(lines=1):
+    now = time.time()
+    return Data(arguments=['train.py'], pid=1234, start_time=now - 60, end_time=now, mode=Mode.SINK,
+                stdin_lines=0, stdout_lines=lines, stderr_lines=0, stdin_buffer='', stdout_buffer='line\n', stderr_buffer='', returncode=0)
+
+
+@unittest.skipIf(TEST_MODE, 'notifications are printed rather than sent with DISCORDIFY_TESTING')
+class EditInPlaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='discordify-test-')
+        self.stub = StubServer().start()
+        self.addCleanup(self.stub.shutdown)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def target(self, *options):
+        argv = ['discordify', '--webhook', self.stub.url, '--edit_in_place', '--retries', '0',
+                '--outbox', os.path.join(self.directory, 'outbox.jsonl'),
+                '--daemon_socket', os.path.join(self.directory, 'missing.sock')] + list(options) + ['--', 'true']
+        with mock.patch.object(sys, 'argv', argv):
+            return Target(Arguments().parse().config)
+
+    def emit(self, target, event, alert=None, lines=1):
+        # an update that does not change the status message is not sent
+        Payload.create(target.config, data(lines), status=target.status, renderer=target.renderer).emit(event, alert)
+
+    def methods(self):
+        return [request['method'] for request in self.stub.requests]
+
+    def test_alerts_and_deadlines_are_new_messages(self):
+        target = self.target()
+        self.emit(target, Event.PERIOD)
+        self.emit(target, Event.ALERT, Alert('stdout', 'ERROR', 'ERROR here', ['ERROR here']))
+        self.emit(target, Event.DEADLINE)
+        self.emit(target, Event.PERIOD, lines=2)
+        self.emit(target, Event.FINAL)
+
+        self.assertEqual(self.methods(), ['POST', 'POST', 'POST', 'PATCH', 'PATCH'])
+        self.assertIn('wait=true', self.stub.requests[0]['path'])
+        self.assertNotIn('wait=true', self.stub.requests[1]['path'])
+
+    def test_final_as_new(self):
+        target = self.target('--final_as_new')
+        self.emit(target, Event.PERIOD)
+        self.emit(target, Event.SIGNAL)
+        self.emit(target, Event.FINAL)
+
+        self.assertEqual(self.methods(), ['POST', 'PATCH', 'POST'])
+
+
+if __name__ == '__main__':
+    unittest.main()
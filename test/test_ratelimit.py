@@ -0,0 +1,21 @@
+import unittest
+
+from discordify import ratelimit
+
+
+class BucketTest(unittest.TestCase):
+
+    def test_zero_does_not_limit_the_rate(self):
+        self.assertIsNone(ratelimit.bucket('http://localhost/unlimited', 0, 5))
+
+    def test_lets_a_burst_through(self):
+        bucket = ratelimit.bucket('http://localhost/burst', 60, 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertGreater(bucket.delay(), 0)
+
+    def test_is_shared_per_webhook(self):
+        self.assertIs(ratelimit.bucket('http://localhost/shared', 30, 5), ratelimit.bucket('http://localhost/shared', 30, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
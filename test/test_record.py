@@ -0,0 +1,32 @@
+import time
+import unittest
+
+from discordify.data import Data
+from discordify.mode import Mode
+from discordify.record import Record, Summary, command_line
+from discordify.render import MAX_SUMMARY_COMMAND, summary_description
+
+
+def data(arguments):
+    now = time.time()
+    return Data(arguments=arguments, pid=1234, start_time=now - 60, end_time=now, mode=Mode.WRAPPER,
+                stdin_lines=0, stdout_lines=0, stderr_lines=0, stdin_buffer='', stdout_buffer='', stderr_buffer='', returncode=0)
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_keeps_the_full_command_line(self):
+        record = Record.from_data(1, data(['python', 'train.py', '--name', 'a b']))
+        self.assertEqual(record.command, "python train.py --name 'a b'")
+        # a command that could not be started is recorded the same way
+        self.assertEqual(record.command, command_line(['python', 'train.py', '--name', 'a b']))
+
+    def test_summary_shortens_long_command_lines(self):
+        record = Record(1, command_line(['python', 'train.py'] + ['--option'] * 50), 0, 1.0)
+        description = summary_description(Summary([record]), 4096)
+        self.assertIn('`python train.py --option', description)
+        self.assertLessEqual(len(description.split('`')[1]), MAX_SUMMARY_COMMAND)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import threading
+import unittest
+from unittest import mock
+
+from discordify.scheduler import Scheduler
+
+
+class Clock:
+    '''A monotonic clock that only moves when told to.'''
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('discordify.scheduler.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = Scheduler()
+        self.calls = []
+
+    def callback(self, name):
+        return lambda: self.calls.append((name, self.clock.now))
+
+    def test_runs_callbacks_in_order_of_their_deadlines(self):
+        self.scheduler.call_later(2, self.callback('late'))
+        self.scheduler.call_later(1, self.callback('early'))
+        self.assertEqual(self.scheduler.timeout(), 1)
+
+        self.clock.now += 1.5
+        self.scheduler.fire()
+        self.assertEqual(self.calls, [('early', 101.5)])
+        self.clock.now += 1
+        self.scheduler.fire()
+        self.assertEqual([name for name, _ in self.calls], ['early', 'late'])
+        self.assertIsNone(self.scheduler.timeout())
+
+    def test_repeating_callbacks_do_not_drift(self):
+        self.scheduler.call_later(1, self.callback('tick'), 1)
+        # every tick runs late, the next one is still due on the grid
+        for _ in range(3):
+            self.clock.now += self.scheduler.timeout() + 0.3
+            self.scheduler.fire()
+        self.assertEqual(self.calls, [('tick', 101.3), ('tick', 102.3), ('tick', 103.3)])
+        self.assertAlmostEqual(self.scheduler.timeout(), 0.7)
+
+    def test_skips_missed_deadlines(self):
+        self.scheduler.call_later(1, self.callback('tick'), 1)
+        # the loop was blocked for several intervals
+        self.clock.now += 5.5
+        self.scheduler.fire()
+        self.assertEqual(self.calls, [('tick', 105.5)])
+        self.assertAlmostEqual(self.scheduler.timeout(), 0.5)
+
+    def test_cancel(self):
+        entry = self.scheduler.call_later(1, self.callback('cancelled'), 1)
+        self.scheduler.call_later(2, self.callback('kept'))
+        self.assertEqual(len(self.scheduler), 2)
+        Scheduler.cancel(entry)
+        self.assertEqual(len(self.scheduler), 1)
+
+        self.clock.now += 3
+        self.scheduler.fire()
+        self.assertEqual([name for name, _ in self.calls], ['kept'])
+        self.assertIsNone(self.scheduler.timeout())
+
+    def test_callbacks_may_schedule_callbacks(self):
+        self.scheduler.call_later(1, lambda: self.scheduler.call_later(1, self.callback('again')))
+        self.clock.now += 1
+        self.scheduler.fire()
+        self.assertEqual(self.scheduler.timeout(), 1)
+
+
+class SchedulerThreadTest(unittest.TestCase):
+
+    def test_runs_on_its_own_thread(self):
+        scheduler = Scheduler()
+        called = threading.Event()
+        scheduler.start()
+        # scheduled after the thread went to sleep without a deadline
+        scheduler.call_later(0.01, called.set)
+        self.assertTrue(called.wait(5))
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import shutil
+import tempfile
+import unittest
+
+from discordify.ansi import Sanitizer
+from discordify.buffer import RingBuffer
+from discordify.spool import Spool
+from discordify.stream import Stream
+
+OUTPUT = [b'\x1b[32mgreen\x1b[0m start\n', b' 10%\r 50%', b'\r100%\n', b'bin\x01\x02\n']
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='discordify-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stream(self, buffer):
+        stream = Stream(None, None, buffer, sanitizer=Sanitizer(), name='stdout')
+        for chunk in OUTPUT:
+            stream.tap(chunk)
+        return stream
+
+    def test_keeps_the_raw_output(self):
+        spool = Spool(self.directory, 'stdout', 10, 100, 1 << 20)
+        self.stream(spool)
+        spool.close()
+
+        with open(spool.path, 'rb') as log:
+            self.assertEqual(log.read(), b''.join(OUTPUT))
+
+    def test_decodes_a_sanitized_tail(self):
+        spool = Spool(self.directory, 'stdout', 10, 100, 1 << 20)
+        self.stream(spool)
+        self.assertEqual(spool.decode(), ['green start', '100%', 'bin'])
+
+    def test_ring_buffer_takes_the_plain_text(self):
+        buffer = RingBuffer(10, 4096, 100)
+        self.stream(buffer)
+        self.assertEqual(buffer.decode(), ['green start', '100%', 'bin'])
+
+
+if __name__ == '__main__':
+    unittest.main()